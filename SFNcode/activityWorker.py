@@ -0,0 +1,309 @@
+""" Shared runtime used by every activity worker
+
+Activities used to run a single "while True" loop that polled for a task and blocked on the work before polling again.
+One long running task (e.g. an ffmpeg transcode) stalled the whole activity type on the host.
+
+An ActivityWorker runs the following for one activity:
+    N poller threads that long-poll the activity queue (SFN get_activity_task or SWF poll_for_activity_task)
+    A bounded pool of worker threads that run the activity handler
+Pollers only poll when a worker slot is free, so we never hold a task we cannot start while its timeout runs.
+The heavy lifting in our activities happens in subprocesses (ffmpeg, exiftool, ImageMagick) or on the network (S3, DynamoDB),
+so threads are enough to saturate the cores and NICs of the host.
+
+Handlers are plain functions: processTask(task, workID) and return the OUTPUT dictionary
+    Raise TaskFailure(result) with a {'reason', 'detail'} dictionary to fail the task
+    Return None to leave the task unanswered (e.g. the operation is not supported yet)
+    Call task['heartbeat'](DETAILS) while long work makes progress. The worker sends at most one heartbeat every
+    HEARTBEAT_INTERVAL seconds (SFN send_task_heartbeat, SWF record_activity_task_heartbeat with DETAILS).
+    Once the task has timed out or was cancelled, the heartbeat raises TaskTimedOut so the handler stops its work
+    (ffmpegHelper.runParallel kills its processes). The task is then left unanswered, it already runs elsewhere
+    Tasks built outside of a worker (e.g. localExecutor) have no 'heartbeat'
+
+The same module is used by both the Step Functions (arn=) and SWF (domain=) activities.
+
+"""
+
+import boto3
+from botocore.client import Config
+import botocore
+import time
+import threading
+import Queue
+import simplejson as json
+
+import logging
+
+# boto3 clients are thread safe once created, but creating them from the default session is not
+# Clients are created once per process under a lock and shared by every worker
+CLIENTS = {}
+CLIENT_LOCK = threading.Lock()
+
+# Minimum seconds between two heartbeats of a task. Well below the HeartbeatSeconds of the activities in IPD.json
+HEARTBEAT_INTERVAL = 30
+
+# Length limits of the failure fields (SFN error and cause, SWF reason and details). The service rejects a longer one,
+# which would leave the task unanswered until it times out
+MAX_REASON_LENGTH = 256
+MAX_DETAIL_LENGTH = 32768
+
+# Heartbeat errors that mean the task token is no longer valid (SFN, SWF)
+TIMED_OUT_ERRORS = ['TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken', 'UnknownResourceFault']
+
+
+def getClient(service, maxPoolConnections=50):
+
+    with CLIENT_LOCK:
+        if service not in CLIENTS:
+            logging.debug("Creating %s boto client", service)
+            # suggestion is the read is higher than connect
+            # Every poller holds a connection for the full long-poll, so the pool needs to be larger than the default of 10
+            botoConfig = Config(connect_timeout=50, read_timeout=70, max_pool_connections=maxPoolConnections)
+            CLIENTS[service] = boto3.client(service, config=botoConfig)
+            logging.debug("Created %s boto client: %s", service, CLIENTS[service])
+
+    return CLIENTS[service]
+
+
+class TaskFailure(Exception):
+
+    # result is the {'reason' : ..., 'detail' : ...} dictionary the activities already build for failures
+    def __init__(self, result):
+        Exception.__init__(self, result['reason'])
+        self.result = result
+
+
+class TaskTimedOut(Exception):
+
+    # Raised by task['heartbeat'] when the service no longer knows the task (timed out, cancelled, already rescheduled)
+    pass
+
+
+class ActivityWorker(object):
+
+    def __init__(self, taskName, handler, arn=None, domain=None, pollers=1, workers=1, client=None):
+
+        self.taskName = taskName
+        self.handler = handler
+        self.arn = arn
+        self.domain = domain
+        self.pollers = pollers
+        self.workers = workers
+
+        # An ARN means the activity belongs to Step Functions, otherwise it is an SWF task list in DOMAIN
+        if arn is not None:
+            self.backend = 'stepfunctions'
+        else:
+            self.backend = 'swf'
+
+        if client is None:
+            client = getClient(self.backend)
+        self.client = client
+
+        # One token per worker thread. A poller must take a token before it polls
+        self.slots = Queue.Queue()
+        for i in range(workers):
+            self.slots.put(True)
+
+        self.tasks = Queue.Queue()
+        self.stopping = threading.Event()
+        self.pollThreads = []
+        self.workThreads = []
+
+    def start(self):
+
+        logging.info("Starting %s with %d pollers and %d workers", self.taskName, self.pollers, self.workers)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name='%s-worker-%02d' % (self.taskName, i + 1))
+            t.daemon = True
+            t.start()
+            self.workThreads.append(t)
+
+        for i in range(self.pollers):
+            t = threading.Thread(target=self._poll, args=('%s-%02d' % (self.taskName, i + 1),), name='%s-poller-%02d' % (self.taskName, i + 1))
+            t.daemon = True
+            t.start()
+            self.pollThreads.append(t)
+
+    def stop(self):
+
+        # Pollers finish their current long-poll (anything they receive is still run), then the workers drain the queue
+        logging.info("Stopping %s", self.taskName)
+        self.stopping.set()
+        for t in self.pollThreads:
+            t.join()
+        for t in self.workThreads:
+            self.tasks.put(None)
+        for t in self.workThreads:
+            t.join()
+        logging.info("Stopped %s", self.taskName)
+
+    def isAlive(self):
+
+        for t in self.pollThreads + self.workThreads:
+            if not t.is_alive():
+                return False
+        return True
+
+    def run(self):
+
+        # Used when the activity runs as its own script
+        self.start()
+        try:
+            while self.isAlive():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def _poll(self, identity):
+
+        while not self.stopping.is_set():
+
+            # Wait for a free worker so that we don't take a task we can't start
+            try:
+                self.slots.get(timeout=1)
+            except Queue.Empty:
+                continue
+
+            try:
+                task = self._pollOnce(identity)
+            except Exception as err:
+                logging.error("%s - Poll failed: %s. Repoll", self.taskName, str(err))
+                self.slots.put(True)
+                time.sleep(5)
+                continue
+
+            if 'taskToken' not in task:
+                logging.info("%s - Poll timed out, no new task. Repoll", self.taskName)
+                self.slots.put(True)
+            else:
+                self.tasks.put(task)
+
+    def _pollOnce(self, identity):
+
+        if self.backend == 'stepfunctions':
+            return self.client.get_activity_task(
+                activityArn=self.arn,
+                workerName=identity
+            )
+
+        return self.client.poll_for_activity_task(
+            domain=self.domain,
+            taskList={'name': self.taskName},
+            identity=identity
+        )
+
+    def _work(self):
+
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            try:
+                self._execute(task)
+            finally:
+                self.slots.put(True)
+
+    def _execute(self, task):
+
+        if self.backend == 'stepfunctions':
+            workID = task['ResponseMetadata']['RequestId']
+        else:
+            workID = task['workflowExecution']['workflowId']
+
+        logging.info("[%s] New request for %s", workID, self.taskName)
+        startTime = time.time()
+        task['heartbeat'] = self._heartbeat(task, workID)
+
+        try:
+            try:
+                OUTPUT = self.handler(task, workID)
+            except TaskFailure as err:
+                logging.error("%s", err.result)
+                self.fail(task, err.result)
+            except TaskTimedOut as err:
+                logging.warning("[%s] %s stopped, the task timed out: %s", workID, self.taskName, str(err))
+            # A bad task should not take the worker down with it
+            except Exception as err:
+                logging.exception("[%s] Unhandled error in %s", workID, self.taskName)
+                result = {
+                    'reason' : 'WRK-0001_Unhandled error in %s' % (self.taskName),
+                    'detail' : str(err)
+                }
+                self.fail(task, result)
+            else:
+                if OUTPUT is None:
+                    logging.warning("[%s] %s returned no result, task left unanswered", workID, self.taskName)
+                else:
+                    self.succeed(task, OUTPUT)
+
+        # Typically the task already timed out or was cancelled
+        except botocore.exceptions.ClientError as err:
+            logging.error("[%s] Could not respond for %s: %s", workID, self.taskName, str(err))
+
+        logging.info("[%s] %s Complete in %.2f seconds", workID, self.taskName, time.time() - startTime)
+
+    def _heartbeat(self, task, workID):
+
+        LAST = [time.time()]
+
+        def heartbeat(DETAILS):
+            logging.debug("[%s] %s progress: %s", workID, self.taskName, DETAILS)
+            if time.time() - LAST[0] < HEARTBEAT_INTERVAL:
+                return
+            LAST[0] = time.time()
+            try:
+                response = self.sendHeartbeat(task, DETAILS)
+            except botocore.exceptions.ClientError as err:
+                if err.response.get('Error', {}).get('Code') in TIMED_OUT_ERRORS:
+                    raise TaskTimedOut(str(err))
+                # Anything else (throttling, network) is not fatal, the next heartbeat may go through
+                logging.warning("[%s] Heartbeat for %s failed: %s", workID, self.taskName, str(err))
+                return
+            # SWF answers a heartbeat with cancelRequested when the workflow asked for the task to be cancelled
+            if response and response.get('cancelRequested'):
+                raise TaskTimedOut('Cancel requested')
+
+        return heartbeat
+
+    def sendHeartbeat(self, task, DETAILS):
+
+        if self.backend == 'stepfunctions':
+            # Step Functions heartbeats carry no details
+            return self.client.send_task_heartbeat(
+                taskToken=task['taskToken']
+            )
+        else:
+            return self.client.record_activity_task_heartbeat(
+                taskToken=task['taskToken'],
+                details=json.dumps(DETAILS)[:2048]
+            )
+
+    def succeed(self, task, OUTPUT):
+
+        if self.backend == 'stepfunctions':
+            self.client.send_task_success(
+                taskToken=task['taskToken'],
+                output=json.dumps(OUTPUT)
+            )
+        else:
+            self.client.respond_activity_task_completed(
+                taskToken=task['taskToken'],
+                result=json.dumps(OUTPUT)
+            )
+
+    def fail(self, task, result):
+
+        if self.backend == 'stepfunctions':
+            self.client.send_task_failure(
+                taskToken=task['taskToken'],
+                error=json.dumps(result['reason'])[:MAX_REASON_LENGTH],
+                cause=json.dumps(result['detail'])[:MAX_DETAIL_LENGTH]
+            )
+        else:
+            self.client.respond_activity_task_failed(
+                taskToken=task['taskToken'],
+                reason=json.dumps(result['reason'])[:MAX_REASON_LENGTH],
+                details=json.dumps(result['detail'])[:MAX_DETAIL_LENGTH]
+            )
@@ -2,22 +2,21 @@
 
 Function will take the following steps:
     Create a thumbnail directory
-    Utilize ImageMagick to create a thumbnail
-    Update the database entry with a Thumbnail section
+    Create the thumbnail in-process with Pillow (thumbnailHelper), ImageMagick for the formats Pillow can't read
+    Create the renditions (thumbnailHelper.RENDITIONS) from the same decode
+    Update the database entry with a Thumbnail section and the rendition map
     Return success or failure
 
 author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
-import botocore
 import sys
 import os
 import subprocess
 import string
 import simplejson as json
+import multiprocessing
 
 import logging
 import logging.config
@@ -26,96 +25,97 @@ sys.path.insert(0, '/Assets/sharedLibraries')
 import parseHelper
 import databaseHelper
 
-def main(args):
+import activityWorker
+import thumbnailHelper
+
+ARN = "arn:aws:states:us-east-1:497940546915:activity:createThumbnailFromImage"
+TASKNAME = 'createThumbnailFromImage'
 
-    ARN = "arn:aws:states:us-east-1:497940546915:activity:createThumbnailFromImage"
-    taskName = os.path.basename(__file__)[:-3]
+# Thumbnail creation is CPU bound, one per core
+POLLERS = 1
+WORKERS = multiprocessing.cpu_count()
+
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
-    logging.debug("Creating SFN boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    sfn = boto3.client('stepfunctions', config=botoConfig)
-    logging.debug("Created SFN boto client: %s", sfn)
 
-    while True:
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, arn=ARN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
 
-        task = sfn.get_activity_task(
-            activityArn=ARN,
-            workerName='%s-01' %(taskName)
-        )
+    INPUT = json.loads(task['input'])
+    asset = INPUT['asset']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
 
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
+    # Re-upload of a deleted asset whose thumbnail and renditions are still in S3 (see dedupHelper)
+    REUSE = INPUT.get('reuse', {})
+    if 'thumbnail' in REUSE and 'renditions' in REUSE:
+        logging.info("[%s] Reusing the existing thumbnail and renditions", workID)
+        OUTPUT = {
+            'tool' : '',
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        return OUTPUT
+
+    scale = (640, 360)
+    newDir = "thumbnails"
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    subDir = parseHelper.createDir(filePath, newDir)
+    outfile = '%s_thumbnail.jpg' % (fileName)
+
+    # The thumbnail and every rendition are written from a single decode of the image
+    # The renditions can be picked per request, otherwise the helper defaults are used
+    RENDITIONOUTPUTS, RENDITIONMAP = thumbnailHelper.renditionOutputs(subDir, newDir, fileName
+        , INPUT.get('renditions', thumbnailHelper.RENDITIONS)
+        , INPUT.get('renditionFormats', thumbnailHelper.RENDITION_FORMATS))
+    OUTPUTS = [('%s/%s' % (subDir, outfile), scale)] + RENDITIONOUTPUTS
+
+    logging.debug("[%s] Execute image thumbnail creation: %s", workID, OUTPUTS)
+    try:
+        output = thumbnailHelper.createThumbnails(asset, OUTPUTS)
+    # We should catch other errors here
+    except subprocess.CalledProcessError as err:
+        
+        result = { 
+            'reason' : 'THB-0001_Error in image thumbnail creation',
+            'detail' : str(err)
+        }
+        
+        raise activityWorker.TaskFailure(result)
         
-        # Run the operation
-        else:
-            taskToken = task['taskToken']
-            workID = task['ResponseMetadata']['RequestId']
-            logging.info("[%s] New request for %s", workID, taskName)
-            
-            INPUT = json.loads(task['input'])
-            asset = INPUT['asset']
-            dbPrimaryKey = INPUT['dbPrimaryKey']
-             # Take the thumbnail 25% through the video
-            scale = "640x360"
-            newDir = "thumbnails"
-            (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
-            subDir = parseHelper.createDir(filePath, newDir)
-            outfile = '%s_thumbnail.jpg' % (fileName)
-
-            cmd = ['convert'
-                    , asset
-                    ,'-format', 'jpg'
-                    ,'-thumbnail', scale
-                    ,'-auto-orient'
-                    ,'%s/%s' %(subDir, outfile)
-                  ]
-
-            logging.debug("[%s] Execute image thumbnail creation: %s", workID, cmd)
-            try:
-                output = subprocess.check_output(cmd)
-                
-                # Start setting the parameters needed to update the thumbnail 
-                key = dbPrimaryKey
-                
-                updateExpression = 'set thumbnail = :t'
-                
-                expressionValues = {
-                    ':t' : '/%s/%s'%(newDir, outfile)
-                }
-                
-                logging.debug("[%s] Update thumbnail value", workID)
-                # Call the update function
-                response = databaseHelper.updateEntry(key, updateExpression, expressionValues)
-                
-                OUTPUT = {
-                    'tool' : output,
-                    'dbPrimaryKey' : dbPrimaryKey,
-                    'assetClass' : INPUT['assetClass'], 
-                    'asset' : asset,
-                }
-
-                sfn.send_task_success(
-                    taskToken=taskToken,
-                    output=json.dumps(OUTPUT)
-                )
-            # We should catch other errors here
-            except subprocess.CalledProcessError as err:
-                
-                result = { 
-                    'reason' : 'THB-0001_Error in image thumbnail creation',
-                    'detail' : str(err)
-                }
-                
-                logging.error("%s", result)
-                
-                sfn.send_task_failure(
-                    taskToken=taskToken,
-                    error=json.dumps(result['reason']),
-                    cause=json.dumps(result['detail'])
-                )
-                    
-            logging.info("[%s] %s Complete", workID, taskName)
+    # Start setting the parameters needed to update the thumbnail 
+    key = dbPrimaryKey
+    
+    updateExpression = 'set thumbnail = :t, renditions = :r'
+    
+    expressionValues = {
+        ':t' : '/%s/%s'%(newDir, outfile),
+        ':r' : RENDITIONMAP,
+    }
+    
+    logging.debug("[%s] Update thumbnail value", workID)
+    # Call the update function
+    response = databaseHelper.updateEntry(key, updateExpression, expressionValues)
+    
+    OUTPUT = {
+        'tool' : output,
+        'dbPrimaryKey' : dbPrimaryKey,
+        'assetClass' : INPUT['assetClass'], 
+        'asset' : asset,
+        'reuse' : REUSE,
+    }
+
+    return OUTPUT
 
 if __name__ == '__main__':
     
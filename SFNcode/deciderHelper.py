@@ -0,0 +1,311 @@
+""" Decision loop shared by the SWF deciders (decider.py and fileManager.py)
+
+The activity graph of each workflow comes from a WorkflowGraph (see workflowGraph.py), this module does the SWF side:
+    Polls for decision tasks and pages through the history, reading only the events that are not cached yet
+    Keeps the events of each running workflow indexed by eventId (WorkflowHistory)
+    Schedules the next activities, several in one decision when the graph runs them in parallel
+    Waits for every branch of a Parallel state before moving on
+    Schedules activities with the HeartbeatSeconds of their state, and schedules an activity that timed out again
+    as often as the Retry of its state allows before the workflow fails
+    Fails the workflow when an activity fails or can't be scheduled
+Every new event of a decision task is acted on, and every decision task is answered (with no decisions if need be).
+
+Functions:
+    decide -- runs the decision loop of a workflow
+    decideEvent -- the decisions for one event
+    pollForDecisionTask -- polls for a decision task and returns the new events
+    executeNextTask / executeNextTasks -- schedule one or more activities
+
+"""
+
+import uuid
+import collections
+import simplejson as json
+
+import logging
+
+import workflowGraph
+
+# Version of every activity type
+VERSION = '1'
+
+# Number of running workflows whose event history is kept between decisions
+HISTORY_CACHE_SIZE = 500
+
+# Decision loop of an SWF workflow
+# Every activity gets the result of the activity before it as its input, the same as in Step Functions
+# startInput turns the workflow input into the input of the first activity
+def decide(swf, domain, taskList, identity, GRAPH, startInput):
+
+    # workflowId -> WorkflowHistory of the events already received, most recently used last
+    HISTORIES = collections.OrderedDict()
+
+    # The decider polls for a minute
+    # we need to continiously loop so that it re-polls
+    while True:
+        
+        # Attempt to polll for a new task
+        
+        logging.debug("Begin poll for event")
+        newTask, history, NEW_EVENTS = pollForDecisionTask(swf, domain, taskList, identity, HISTORIES)
+
+        
+        # Look for a new task using "Task Token"
+        if 'taskToken' not in newTask:
+            logging.info("No new event found in poll. Repoll")
+            continue
+
+        # Debuging for knowledge
+        # Every non-decision event since the previous decision is acted on, in eventId order
+        logging.debug("Recieved new events: %s", NEW_EVENTS)
+        workflow_events = [e for e in NEW_EVENTS
+                           if not e['eventType'].startswith('Decision')]
+        workID = newTask['workflowExecution']['workflowId']
+        taskToken = newTask['taskToken']
+
+        decisions = []
+        JOINED = set()
+        closed = False
+        for event in workflow_events:
+            EVENT_DECISIONS, closed = decideEvent(event, history, GRAPH, startInput, workID, JOINED)
+            decisions.extend(EVENT_DECISIONS)
+            # Nothing can follow a completed or failed workflow
+            if closed:
+                break
+
+        # Every decision task is answered, with no decisions when there is nothing to do (e.g. a branch of a Parallel
+        # state completed and the others are still running), so that it doesn't time out and come back
+        if not decisions:
+            logging.info("[%s] No new decisions for events: %s", workID, [e['eventType'] for e in workflow_events])
+        swf.respond_decision_task_completed(taskToken=taskToken, decisions=decisions)
+
+        if closed:
+            logging.info("Task has been completed: %s", taskToken)
+            HISTORIES.pop(workID, None)
+
+# Decisions for one event of the history
+# Returns the list of decisions and whether they close the workflow
+# JOINED holds the joins already passed in this decision task: when every branch of a Parallel state completes in the same
+# batch of events, each completion sees the join as done and the next state must only be scheduled once
+def decideEvent(event, history, GRAPH, startInput, workID, JOINED):
+
+    eventType = event['eventType']
+    logging.info("[%s] Event Type: %s, Event: %s", workID, eventType, event)
+
+    if eventType == 'WorkflowExecutionStarted':
+        # At the start, get the worker to fetch the first assignment.
+        # The input is buried within workflowExecutionStartedEventAttributes
+        parameters = json.loads(event['workflowExecutionStartedEventAttributes']['input'], use_decimal=True)
+        logging.debug("[%s] Parameters received: %s",workID, parameters)
+
+        taskInput = startInput(parameters)
+        transition = GRAPH.start(taskInput)
+
+    elif eventType == 'ActivityTaskCompleted':
+        # Take decision based on the name of activity that has just completed.
+        # 1) Get activity's event id.
+        event_attrs = event['activityTaskCompletedEventAttributes']
+
+        # 2) Extract its name.
+        activity_name = activityName(history, event_attrs['scheduledEventId'])
+
+        # 3) Get the result from the activity. NOTE: Run checks for those functions without a result
+        result = json.loads(event_attrs.get('result'), use_decimal=True)
+
+        logging.debug("[%s] Completed Activity Name: %s", workID, activity_name)
+        logging.debug("[%s] Completed Activity Result: %s", workID, result)
+
+        taskInput = result
+        transition = GRAPH.next(activity_name, result)
+
+        # End of a Parallel state. Whichever activity finishes last moves the workflow on
+        if transition.join:
+            join = tuple(sorted(transition.join))
+            if not history.joined(transition.join) or join in JOINED:
+                logging.info("[%s] %s completed, waiting for: %s", workID, activity_name, transition.join)
+                return [], False
+            JOINED.add(join)
+
+    elif eventType == 'ActivityTaskTimedOut':
+        # Typically a hung ffmpeg that stopped sending heartbeats. The same activity is scheduled again with the same input
+        event_attrs = event['activityTaskTimedOutEventAttributes']
+        activity_attrs = history.get(event_attrs['scheduledEventId'])['activityTaskScheduledEventAttributes']
+        activity_name = activity_attrs['activityType']['name']
+        logging.warning("[%s] %s timed out (%s)", workID, activity_name, event_attrs['timeoutType'])
+
+        if history.attempts.get(activity_name, 0) > GRAPH.timeoutRetries.get(activity_name, 0):
+            logging.error("[%s] %s timed out on every attempt, failing the workflow", workID, activity_name)
+            return [failWorkflowExecution('WRK-0003_%s timed out' % (activity_name), event_attrs.get('details', event_attrs['timeoutType']))], True
+
+        taskInput = json.loads(activity_attrs['input'], use_decimal=True)
+        transition = workflowGraph.Transition([activity_name], None)
+
+    elif eventType == 'ActivityTaskFailed':
+        # The activity raised TaskFailure, its reason (e.g. REG-0001) is the reason of the workflow
+        event_attrs = event['activityTaskFailedEventAttributes']
+        activity_name = activityName(history, event_attrs['scheduledEventId'])
+        logging.error("[%s] %s failed: %s", workID, activity_name, event_attrs.get('reason'))
+        return [failWorkflowExecution(event_attrs.get('reason', '%s failed' % (activity_name)), event_attrs.get('details', ''))], True
+
+    elif eventType == 'ScheduleActivityTaskFailed':
+        # e.g. the activity type is not registered in the domain
+        event_attrs = event['scheduleActivityTaskFailedEventAttributes']
+        activity_name = event_attrs['activityType']['name']
+        logging.error("[%s] %s could not be scheduled: %s", workID, activity_name, event_attrs['cause'])
+        return [failWorkflowExecution('WRK-0004_%s could not be scheduled' % (activity_name), event_attrs['cause'])], True
+
+    else:
+        # ActivityTaskScheduled / ActivityTaskStarted, signals, ... need no decision
+        logging.debug("[%s] No decision for event type: %s", workID, eventType)
+        return [], False
+
+    if transition.tasks:
+        return [scheduleActivityTask(taskName, VERSION, taskInput, taskName, str(GRAPH.heartbeats.get(taskName, 'NONE'))) for taskName in transition.tasks], False
+
+    # Completion
+    return [
+        {
+            'decisionType': 'CompleteWorkflowExecution',
+            'completeWorkflowExecutionDecisionAttributes': {
+            'result': 'success'
+            }
+        }
+    ], True
+
+def activityName(history, scheduledEventId):
+
+    return history.get(scheduledEventId)['activityTaskScheduledEventAttributes']['activityType']['name']
+
+# reason and details are truncated to the SWF limits (256 and 32768 characters)
+def failWorkflowExecution(reason, details):
+
+    return {
+        'decisionType': 'FailWorkflowExecution',
+        'failWorkflowExecutionDecisionAttributes': {
+            'reason': reason[:256],
+            'details': details[:32768]
+        }
+    }
+
+class WorkflowHistory(object):
+
+    # Events of one workflow execution indexed by eventId
+    def __init__(self, runId):
+
+        self.runId = runId
+        self.events = {}
+        self.lastEventId = 0
+        # Latest ActivityTaskScheduled eventId of each activity, and the scheduled eventIds that completed
+        self.scheduled = {}
+        self.completed = set()
+        # Number of times each activity was scheduled
+        self.attempts = {}
+
+    def add(self, events):
+
+        # The first page of a decision task usually repeats events that are already cached
+        events = [e for e in events if e['eventId'] not in self.events]
+        for e in events:
+            self.events[e['eventId']] = e
+            if e['eventId'] > self.lastEventId:
+                self.lastEventId = e['eventId']
+
+        # Pages arrive newest first, so the scheduled events are taken in eventId order to keep the latest of each activity
+        for e in sorted(events, key=lambda e: e['eventId']):
+            if e['eventType'] == 'ActivityTaskScheduled':
+                name = e['activityTaskScheduledEventAttributes']['activityType']['name']
+                self.scheduled[name] = e['eventId']
+                self.attempts[name] = self.attempts.get(name, 0) + 1
+            elif e['eventType'] == 'ActivityTaskCompleted':
+                self.completed.add(e['activityTaskCompletedEventAttributes']['scheduledEventId'])
+
+    def get(self, eventId):
+
+        return self.events[eventId]
+
+    def joined(self, taskNames):
+
+        # True once the latest run of every activity in taskNames has completed
+        for taskName in taskNames:
+            if self.scheduled.get(taskName) not in self.completed:
+                return False
+        return True
+
+
+def pollForDecisionTask(swf, domain, taskList, identity, HISTORIES):
+
+    # Returns the decision task, the WorkflowHistory of its workflow and the events that arrived since the previous decision
+    # The history is requested newest first, so paging can stop as soon as it reaches events that are already cached.
+    # Without a cached history (new workflow, or the decider restarted) every page is read.
+    pollArgs = {
+        'domain' : domain,
+        'taskList' : {'name': taskList },
+        'identity' : identity,
+        'reverseOrder' : True
+    }
+    newTask = swf.poll_for_decision_task(**pollArgs)
+    if 'taskToken' not in newTask:
+        return newTask, None, []
+
+    workID = newTask['workflowExecution']['workflowId']
+    runId = newTask['workflowExecution']['runId']
+    history = HISTORIES.pop(workID, None)
+    if history is None or history.runId != runId:
+        history = WorkflowHistory(runId)
+
+    EVENTS = list(newTask['events'])
+    nextPageToken = newTask.get('nextPageToken')
+    while nextPageToken and EVENTS[-1]['eventId'] > history.lastEventId + 1:
+        page = swf.poll_for_decision_task(nextPageToken=nextPageToken, **pollArgs)
+        EVENTS.extend(page['events'])
+        nextPageToken = page.get('nextPageToken')
+
+    history.add(EVENTS)
+    HISTORIES[workID] = history
+    while len(HISTORIES) > HISTORY_CACHE_SIZE:
+        HISTORIES.popitem(last=False)
+
+    # Only the events after the previous decision need a decision
+    previous = newTask.get('previousStartedEventId', 0)
+    NEW_EVENTS = [history.get(eventId) for eventId in range(previous + 1, history.lastEventId + 1) if eventId in history.events]
+
+    logging.debug("[%s] Read %d events, %d new since event %d", workID, len(EVENTS), len(NEW_EVENTS), previous)
+
+    return newTask, history, NEW_EVENTS
+
+# Function that will run the task completed call
+# This is reused across all activities, minus the ending function
+def executeNextTask(swf,taskToken, taskName, taskVersion, taskInput, taskList):
+
+    executeNextTasks(swf, taskToken, [(taskName, taskVersion, taskInput, taskList)])
+
+# Several activities can be scheduled from a single decision, and SWF runs them in parallel
+# TASKS is a list of (taskName, taskVersion, taskInput, taskList) or (taskName, taskVersion, taskInput, taskList, heartbeatTimeout)
+def executeNextTasks(swf, taskToken, TASKS):
+
+    decisions = [scheduleActivityTask(*TASK) for TASK in TASKS]
+
+    swf.respond_decision_task_completed(
+        taskToken=taskToken, # keeps the same token throughout the execution
+        decisions = decisions
+    ) # end bracket respond
+
+# heartbeatTimeout is in seconds, as a string. Activities that don't send heartbeats keep 'NONE'
+def scheduleActivityTask(taskName, taskVersion, taskInput, taskList, heartbeatTimeout='NONE'):
+
+    return {
+            'decisionType': 'ScheduleActivityTask',
+            'scheduleActivityTaskDecisionAttributes': {
+                'activityType':{
+                    'name': taskName, # string
+                    'version': taskVersion # string
+                    },
+                'activityId': 'activityid-' + str(uuid.uuid4()),
+                'input': json.dumps(taskInput, use_decimal=True),
+                'scheduleToCloseTimeout': 'NONE',
+                'scheduleToStartTimeout': 'NONE',
+                'startToCloseTimeout': 'NONE',
+                'heartbeatTimeout': heartbeatTimeout,
+                'taskList': {'name': taskList}, # TASKLIST is a string
+                }
+            }
@@ -0,0 +1,153 @@
+""" Long running exiftool process driven in -stay_open batch mode
+
+Starting exiftool loads Perl and all of its modules, which costs far more than reading the tags of a small JPEG.
+Instead of forking exiftool for every image, each worker thread keeps one exiftool running with "-stay_open True -@ -"
+and writes its requests to stdin:
+    One argument per line, ending with -execute{N}
+    exiftool writes the JSON for the request to stdout followed by a {readyN} line
+The process is restarted if it dies, and the request is retried once on the new process.
+
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+import atexit
+import simplejson as json
+
+import logging
+
+# -j is used for JSON
+# -d formats the dates into standard UTC
+# -c formats the GPS to decimal
+# The quotes are part of the format strings (the old command line passed them through), metadataHelper.normalize strips them
+COMMON_ARGS = ['-j', '-d', '"%Y-%m-%dT%H:%M:%S+0000"', '-c', '"%+.8f"']
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifTool(object):
+
+    def __init__(self, executable='exiftool'):
+
+        self.executable = executable
+        self.process = None
+        self.errors = None
+        self.counter = 0
+
+    def start(self):
+
+        # stderr goes to a file so that warnings can never fill a pipe and block exiftool
+        if self.errors is not None:
+            self.errors.close()
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self.errors
+        )
+        logging.debug("Started exiftool process: %s", self.process.pid)
+
+    def stop(self):
+
+        if self.process is None:
+            return
+
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write('-stay_open\nFalse\n')
+                self.process.stdin.flush()
+                self.process.wait()
+        except (IOError, OSError):
+            pass
+
+        self.errors.close()
+        self.errors = None
+        self.process = None
+
+    def running(self):
+
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, assets):
+
+        # Returns a dictionary of asset -> tag dictionary
+        # Assets that exiftool could not read are left out. The caller decides what that means
+        try:
+            return self._execute(assets)
+        except (IOError, OSError, ExifToolError) as err:
+            logging.warning("exiftool failed (%s), restarting", str(err))
+            self.stop()
+            return self._execute(assets)
+
+    def _execute(self, assets):
+
+        if not self.running():
+            self.start()
+
+        self.counter = self.counter + 1
+        ready = '{ready%d}' % (self.counter)
+        self.errors.seek(0, os.SEEK_END)
+        errorStart = self.errors.tell()
+
+        ARGS = COMMON_ARGS + list(assets) + ['-execute%d' % (self.counter)]
+        self.process.stdin.write('\n'.join(ARGS) + '\n')
+        self.process.stdin.flush()
+
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if line == '':
+                self.process.wait()
+                raise ExifToolError('exiftool exited while processing %s' % (assets))
+            if line.rstrip('\r\n') == ready:
+                break
+            lines.append(line)
+
+        self.errors.seek(errorStart)
+        errors = self.errors.read()
+        if errors:
+            logging.debug("exiftool reported: %s", errors)
+
+        output = ''.join(lines).strip()
+        if output == '':
+            return {}
+
+        # Parsing with decimals, as floats are not permitted by dynamoDB
+        TAGS = {}
+        for entry in json.loads(output, use_decimal=True):
+            TAGS[entry['SourceFile']] = entry
+
+        return TAGS
+
+
+# One exiftool per worker thread. A single exiftool can only run one request at a time
+LOCAL = threading.local()
+INSTANCES = []
+INSTANCE_LOCK = threading.Lock()
+
+
+def getExifTool():
+
+    instance = getattr(LOCAL, 'exiftool', None)
+    if instance is None:
+        instance = ExifTool()
+        LOCAL.exiftool = instance
+        with INSTANCE_LOCK:
+            INSTANCES.append(instance)
+
+    return instance
+
+
+def stopAll():
+
+    with INSTANCE_LOCK:
+        for instance in INSTANCES:
+            instance.stop()
+
+
+atexit.register(stopAll)
@@ -1,5 +1,3 @@
-import boto3
-from botocore.client import Config
 import sys
 import os
 import simplejson as json
@@ -9,68 +7,75 @@ import logging.config
 sys.path.insert(0, '/Assets/sharedLibraries/')
 import parseHelper
 
+import activityWorker
+import signatureHelper
 
-def main(args):
 
+ARN = "arn:aws:states:us-east-1:497940546915:activity:identifyAssetClass"
+TASKNAME = 'identifyAssetClass'
+
+# Classification is a read of the first few KB and a trie walk, so this activity is cheap and mostly waits on the network
+POLLERS = 2
+WORKERS = 8
+
+EXT = {}
 
-    ARN = "arn:aws:states:us-east-1:497940546915:activity:identifyAssetClass"
-    taskName = os.path.basename(__file__)[:-3]
+# The Type files are next to this script
+TYPES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
 
-    logging.debug("Creating SFN boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    sfn = boto3.client('stepfunctions', config=botoConfig)
-    logging.debug("Created SFN boto client: %s", sfn)
-    
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
     # Should this be moved to the loop? Dyanmically change the item?
-    EXT = loadExts()
+    EXT.update(loadExts())
     logging.info("Extension listing: %s", EXT)
-    while True:
-
-        task = sfn.get_activity_task(
-            activityArn=ARN,
-            workerName='%s-01' %(taskName)
-        )
-
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
-        
-        # Run the operation
-        else:
-            
-            logging.info(task)
-            taskToken = task['taskToken']
-            workID = task['ResponseMetadata']['RequestId']
-            
-            logging.info("[%s] New request for %s", workID, taskName)
-            logging.debug("[%s] Input: %s", workID, task['input'])
-            parameters = json.loads(task['input'])
-            asset = parameters['asset']
-
-             # get the extensions
-            filePath, fileName, fileExt = parseHelper.splitFilename(asset)
-            # get the AssetClass
-            # Extension will return with the period. We must nix this from the front
-            try:
-                assetClass = EXT[fileExt[1:].lower()]
-            except KeyError:
-                assetClass = "Other"
-                logging.debug("[%s] File extension NOT found in list: %s", taskToken, fileExt)
-
-            # metadata and asset are passthrough
-            OUTPUT = { 
-                'assetClass' : assetClass, 
-                'metadata' : parameters['metadata'], 
-                'asset' : asset,
-            }
-            
-            sfn.send_task_success(
-                taskToken=taskToken,
-                output=json.dumps(OUTPUT)
-                )
-        
-            logging.info("[%s] %s Complete", workID, taskName)
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, arn=ARN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    logging.info(task)
+    taskToken = task['taskToken']
+
+    logging.debug("[%s] Input: %s", workID, task['input'])
+    parameters = json.loads(task['input'])
+    asset = parameters['asset']
+
+    # createWorker loads the extensions. Activities called in-process (localExecutor.py) don't go through it
+    if not EXT:
+        EXT.update(loadExts())
+
+     # get the extensions
+    filePath, fileName, fileExt = parseHelper.splitFilename(asset)
+    # get the AssetClass
+    # Extension will return with the period. We must nix this from the front
+    extClass = EXT.get(fileExt[1:].lower())
+    if extClass is None:
+        logging.debug("[%s] File extension NOT found in list: %s", taskToken, fileExt)
+
+    # The content decides, the extension is the tiebreaker for containers that hold audio or video (and the fallback)
+    SIGNATURE = signatureHelper.classify(asset, extClass)
+    assetClass = SIGNATURE['assetClass']
+    logging.info("[%s] Asset class %s from %s: %s", workID, assetClass, SIGNATURE['source'], SIGNATURE)
+
+    # metadata and asset are passthrough
+    OUTPUT = { 
+        'assetClass' : assetClass, 
+        'metadata' : parameters['metadata'], 
+        'asset' : asset,
+        'mimeType' : SIGNATURE['mimeType'],
+        'container' : SIGNATURE['container'],
+    }
+
+    return OUTPUT
 
 
 
@@ -86,13 +91,13 @@ def loadExts():
 
     logging.debug("Beginning loop to load extension configuration")
     for t in Types:
-        fn = "Type%s" % t
+        fn = os.path.join(TYPES_DIR, "Type%s" % t)
         logging.debug("Opening filename: %s", fn)
-        f = open(fn,'r')
-        exts = f.readlines()
+        with open(fn,'r') as f:
+            exts = [e.strip() for e in f.readlines() if e.strip()]
         for e in exts:
-            logging.debug("Adding %s to %s type", e[:-1], t)
-            EXTENSIONS[e[:-1]] = t
+            logging.debug("Adding %s to %s type", e, t)
+            EXTENSIONS[e.lower()] = t
 
     return EXTENSIONS
 
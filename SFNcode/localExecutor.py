@@ -0,0 +1,175 @@
+""" Runs the ingest state machine (IPD.json) in-process, without Step Functions or SWF
+
+Every step of a Step Functions execution costs a long-poll, a JSON round trip and a task token response.
+For a small image that is more than the work itself. The local executor walks the same definition (see workflowGraph.py)
+and calls each activity's processTask directly:
+    Task -- processTask(task, workID) of the activity module, with the input serialized the same way as Step Functions does
+    Choice -- evaluated on the result of the previous activity
+    Parallel -- one thread per branch, the next state gets the list of branch results (like Step Functions)
+The time spent in each activity is recorded, so real work can be compared with the orchestration overhead of the cloud runs.
+
+Uses:
+    Fast lane for small assets (isFastLane), which skip the queues entirely. testHarness.runTest, the ingest entry point
+    in this tree, runs assets up to FAST_LANE_BYTES here and starts a Step Functions execution for the others
+    Offline test runs of the whole ingest on a single host
+
+Usage: python localExecutor.py <asset> [metadata json]
+
+"""
+
+import sys
+import os
+import time
+import uuid
+import threading
+import importlib
+import simplejson as json
+
+import logging
+import logging.config
+
+import activityWorker
+import workflowGraph
+
+DEFINITION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'IPD.json')
+
+# Assets up to this size are worth running in-process instead of through Step Functions
+FAST_LANE_BYTES = 20 * 1024 * 1024
+
+
+def main(args):
+
+    logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
+
+    INPUT = {
+        'asset' : args[1],
+        'metadata' : {},
+    }
+    if len(args) > 2:
+        INPUT['metadata'] = json.loads(args[2], use_decimal=True)
+
+    executor = LocalExecutor()
+    OUTPUT = executor.execute(INPUT)
+
+    print json.dumps(OUTPUT, use_decimal=True, indent=4)
+    print json.dumps(executor.timings, indent=4)
+
+
+def isFastLane(asset):
+
+    return os.path.getsize(asset) <= FAST_LANE_BYTES
+
+
+class LocalExecutor(object):
+
+    def __init__(self, definition=DEFINITION):
+
+        self.graph = workflowGraph.load(definition)
+        self.modules = {}
+        self.moduleLock = threading.Lock()
+        # (activity, seconds) of every activity run by the last execute, in completion order
+        self.timings = []
+        self.timingLock = threading.Lock()
+
+    def execute(self, INPUT, workID=None):
+
+        # Returns the output of the last state, raises activityWorker.TaskFailure if an activity fails
+        if workID is None:
+            workID = 'local-%s' % (uuid.uuid4())
+
+        self.timings = []
+        startTime = time.time()
+        logging.info("[%s] Local execution of %s", workID, INPUT.get('asset'))
+
+        transition, OUTPUT = self._follow(self.graph.start(INPUT).tasks, INPUT, workID)
+
+        seconds = time.time() - startTime
+        work = sum([s for (activity, s) in self.timings])
+        logging.info("[%s] Local execution complete in %.2f seconds (%.2f seconds in activities)", workID, seconds, work)
+
+        return OUTPUT
+
+    def _follow(self, tasks, INPUT, workID):
+
+        # Runs the workflow from "tasks" until it ends, or until the end of the Parallel branch it is in
+        # Returns the last transition and the output of the last activity
+        transition = workflowGraph.Transition([], None)
+        while tasks:
+            if len(tasks) == 1:
+                OUTPUT = self._call(tasks[0], INPUT, workID)
+                transition = self.graph.next(tasks[0], OUTPUT)
+                if transition.join:
+                    return transition, OUTPUT
+            else:
+                RESULTS = self._parallel(tasks, INPUT, workID)
+                transition = RESULTS[0][0]
+                OUTPUT = [output for (t, output) in RESULTS]
+
+            tasks = transition.tasks
+            INPUT = OUTPUT
+
+        return transition, INPUT
+
+    def _parallel(self, tasks, INPUT, workID):
+
+        # One thread per branch. Each branch runs until it reaches the join of its Parallel state
+        RESULTS = [None] * len(tasks)
+        ERRORS = []
+
+        def branch(i, task):
+            try:
+                RESULTS[i] = self._follow([task], INPUT, workID)
+            except Exception as err:
+                ERRORS.append(err)
+
+        threads = []
+        for (i, task) in enumerate(tasks):
+            t = threading.Thread(target=branch, args=(i, task), name='%s-%s' % (workID, task))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        if ERRORS:
+            raise ERRORS[0]
+
+        return RESULTS
+
+    def _call(self, activity, INPUT, workID):
+
+        module = self._module(activity)
+
+        # The same serialization as a real task, so the activities can't tell the difference
+        task = {
+            'taskToken' : 'local',
+            'input' : json.dumps(INPUT, use_decimal=True),
+        }
+
+        startTime = time.time()
+        OUTPUT = module.processTask(task, workID)
+        seconds = time.time() - startTime
+
+        with self.timingLock:
+            self.timings.append((activity, round(seconds, 3)))
+        logging.info("[%s] %s Complete in %.2f seconds", workID, activity, seconds)
+
+        if OUTPUT is None:
+            result = {
+                'reason' : 'WRK-0002_%s returned no result' % (activity),
+                'detail' : 'The activity left the task unanswered, which a local execution cannot wait for'
+            }
+            raise activityWorker.TaskFailure(result)
+
+        return json.loads(json.dumps(OUTPUT, use_decimal=True), use_decimal=True)
+
+    def _module(self, activity):
+
+        with self.moduleLock:
+            if activity not in self.modules:
+                self.modules[activity] = importlib.import_module(activity)
+            return self.modules[activity]
+
+
+if __name__ == '__main__':
+
+    main(sys.argv)
@@ -0,0 +1,292 @@
+""" Single metadata engine for every asset class
+
+extractExifMetadata and extractMediainfoMetadata each had their own mapping table and post processing loops, and the MediaInfo
+path kept only the last Video and Audio track. Both activities now build their document here:
+    The cheapest prober for the container runs once -- the worker's exiftool process for images, the MediaInfo library otherwise
+    Every field goes through one precompiled table that says where it lands (General or the track) and how it is converted
+    Every track is kept. The first Video / Audio track is DOC['Video'] / DOC['Audio'] as before,
+    the following ones are nested under 'Video #2', 'Audio #2', ... of the same dictionary
+
+To add or remove a field, change FIELDS. Nothing else walks the dictionaries.
+
+Functions:
+    probe -- the (G, TRACKS) of an asset with the prober picked for it
+    probeImages -- exiftool tags of several images with a single request
+    processFile -- the complete metadata document of an asset
+    processImages -- the documents of several images from a single exiftool request, for bulk imports
+    mediaSummary -- the container and first track properties of a document, small enough to pass between activities
+
+"""
+
+import sys
+import time
+import string
+from pymediainfo import MediaInfo
+
+import logging
+
+sys.path.insert(0, '/Assets/sharedLibraries/')
+import parseHelper
+
+import activityWorker
+import checksumHelper
+import exiftoolHelper
+import geocodeHelper
+
+# Prober for each asset class, MediaInfo for anything not listed
+PROBERS = {
+    'Image' : 'exiftool',
+}
+
+# Field actions
+GENERAL = 'general'   # moved to the General dictionary under the new name
+RENAME = 'rename'     # kept in the track under the new name
+DATE = 'date'         # kept in the track, converted with parseHelper.parseDate
+GPS = 'gps'           # ISO 6709 location, split into Latitude / Longitude / Altitude in General
+ALTITUDE = 'altitude' # "123 m Above Sea Level" -- moved to General as the number only
+DROP = 'drop'         # not stored
+
+# prober -> {source field : (action, new name)}
+# Fields not listed stay in their track unchanged
+FIELDS = {
+    'exiftool' : {
+        'SourceFile' : (DROP, None),
+        'ThumbnailImage' : (DROP, None),
+        'GPSLatitude' : (GENERAL, 'Latitude'),
+        'GPSLongitude' : (GENERAL, 'Longitude'),
+        'GPSAltitude' : (ALTITUDE, 'Altitude'),
+        'Make' : (GENERAL, 'make'),
+        'Model' : (GENERAL, 'model'),
+        'Software' : (GENERAL, 'software'),
+        'GPSDateTime' : (GENERAL, 'recorded_date'),
+        #'DateTimeOriginal' : (GENERAL, 'Recorded date'), # This field is not 100% accurate
+        'FileSize' : (GENERAL, 'file_size'),
+    },
+    'mediainfo' : {
+        'comapplequicktimemake' : (RENAME, 'make'),
+        'comapplequicktimemodel' : (RENAME, 'model'),
+        'comapplequicktimecreationdate' : (RENAME, 'recorded_date'),
+        'comapplequicktimesoftware' : (RENAME, 'software'),
+        'comapplequicktimelocationiso6709' : (GPS, None),
+        'encoded_date' : (DATE, 'encoded_date'),
+        'tagged_date' : (DATE, 'tagged_date'),
+        'file_last_modification_date' : (DATE, 'file_last_modification_date'),
+    },
+}
+
+# Track types of each prober that are stored in the document, under their own name
+# MediaInfo reports the cover art of audio and video files as an Image track, which is not stored
+TRACK_TYPES = {
+    'exiftool' : ['Image'],
+    'mediainfo' : ['Video', 'Audio'],
+}
+
+# MediaInfo fields of the first Video / Audio track that go in the media summary
+SUMMARY_FIELDS = {
+    'Video' : ['format', 'format_profile', 'bit_rate', 'width', 'height', 'bit_depth', 'chroma_subsampling', 'scan_type'],
+    'Audio' : ['format', 'format_profile', 'bit_rate', 'channel_s'],
+}
+
+
+def proberFor(assetClass):
+
+    return PROBERS.get(assetClass, 'mediainfo')
+
+
+def probeImages(assets):
+
+    # Reads the tags of every asset with a single request to this worker's exiftool process
+    # Returns the (G, TRACKS) of each asset in the same order as assets. Assets that exiftool could not read come back as None
+    TAGS = exiftoolHelper.getExifTool().execute(assets)
+
+    RESULTS = []
+    for asset in assets:
+        if asset in TAGS:
+            RESULTS.append(normalize('exiftool', [('Image', TAGS[asset])]))
+        else:
+            logging.warning("No EXIF data returned for: %s", asset)
+            RESULTS.append(None)
+
+    return RESULTS
+
+
+def probe(asset, assetClass):
+
+    # Returns G and a dictionary of track dictionaries (Image, or Video and Audio), or None if the prober could not read the asset
+    prober = proberFor(assetClass)
+    if prober == 'exiftool':
+        return probeImages([asset])[0]
+
+    # Using "to_data" loads the track information into a dictionary
+    MI = MediaInfo.parse(asset)
+    return normalize('mediainfo', [(track.track_type, track.to_data()) for track in MI.tracks])
+
+
+def normalize(prober, TRACKDATA):
+
+    # TRACKDATA is a list of (track type, field dictionary), in the order the prober returned them
+    MAPPING = FIELDS[prober]
+    G = {}
+    TRACKS = {}
+    COUNTS = {}
+
+    for (trackType, DATA) in TRACKDATA:
+
+        if trackType == 'General':
+            T = G
+        elif trackType in TRACK_TYPES[prober]:
+            COUNTS[trackType] = COUNTS.get(trackType, 0) + 1
+            T = TRACKS.setdefault(trackType, {})
+            if COUNTS[trackType] > 1:
+                T['%s #%d' % (trackType, COUNTS[trackType])] = {}
+                T = T['%s #%d' % (trackType, COUNTS[trackType])]
+        else:
+            # Menu, Text, ... tracks are not stored
+            continue
+
+        for (key, value) in DATA.items():
+            # MediaInfo repeats most fields in other formats under other_*
+            if key[:5] == 'other':
+                continue
+
+            # The exiftool date and GPS formats have quotes around them. This will parse them out
+            if prober == 'exiftool':
+                try:
+                    value = value.replace('"','')
+                except AttributeError:
+                    pass
+
+            (action, name) = MAPPING.get(key, (None, None))
+            if action is None:
+                T[key] = value
+            elif action == RENAME:
+                T[name] = value
+            elif action == GENERAL:
+                G[name] = value
+            elif action == DATE:
+                T[name] = parseHelper.parseDate(value)
+            elif action == ALTITUDE:
+                # Altitude information comes back with string information
+                G[name] = string.split(value, " ")[0]
+            elif action == GPS:
+                latitude, longitude, altitude = parseHelper.parseGPS(value)
+                G.setdefault('Latitude', latitude)
+                G.setdefault('Longitude', longitude)
+                if altitude != '':
+                    G.setdefault('Altitude', altitude)
+
+    # If we don't get a GPS date, use the Original date
+    IMAGE = TRACKS.get('Image', {})
+    if 'recorded_date' not in G and 'DateTimeOriginal' in IMAGE:
+        G['recorded_date'] = IMAGE['DateTimeOriginal']
+
+    # Address of the Lat/Long if it is cached. Otherwise it is fetched in the background and registerAsset adds it later
+    if 'Latitude' in G and 'Longitude' in G and 'Address' not in G:
+        address = geocodeHelper.lookup(G['Latitude'], G['Longitude'])
+        if address is not None:
+            G['Address'] = address
+
+    return G, TRACKS
+
+
+def processFile(asset, METADATA, assetClass, sha1=None):
+    # For each asset we need
+    # Account
+    # User
+    # DateTime Added
+    # Sha1
+    # Filename
+    # General Metadata
+    # Image, or Video and Audio tracks
+
+    # Unless the caller has the checksum already, the asset is streamed while the prober reads it, so the file only comes over the network once
+    checksum = None
+    if sha1 is None:
+        checksum = checksumHelper.startChecksums(asset)
+
+    try:
+        PARSED = probe(asset, assetClass)
+    except (IOError, OSError, exiftoolHelper.ExifToolError) as err:
+        PARSED = None
+        detail = str(err)
+    else:
+        detail = '%s could not read %s' % (proberFor(assetClass), asset)
+
+    if checksum is not None:
+        sha1 = checksum.result()['sha1']
+
+    if PARSED is None:
+        result = {
+            'reason' : 'EXF-0001_Error in metadata extraction',
+            'detail' : detail
+        }
+        raise activityWorker.TaskFailure(result)
+
+    return buildDocument(asset, PARSED, METADATA, assetClass, sha1)
+
+
+def processImages(assets, METADATA):
+
+    # Bulk imports (e.g. a camera roll) read the tags of every image with one request to this worker's exiftool process
+    # The images are small and exiftool has just read them, so they are hashed one after the other from the page cache
+    # Returns a dictionary of asset -> document. Images exiftool could not read are logged and left out
+    DOCS = {}
+    for (asset, PARSED) in zip(assets, probeImages(assets)):
+        if PARSED is None:
+            continue
+        sha1 = checksumHelper.computeChecksums(asset)['sha1']
+        DOCS[asset] = buildDocument(asset, PARSED, METADATA, 'Image', sha1)
+
+    return DOCS
+
+
+def buildDocument(asset, PARSED, METADATA, assetClass, sha1):
+
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    G, TRACKS = PARSED
+
+    # Start Constructing Document
+    DOC = {}
+    DOC['Filename'] = fileName
+    DOC['Extension'] = fileExt
+    DOC['Asset_Class'] = assetClass
+    DOC['Checksum'] = sha1
+    DOC['Imported_Time'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000",time.gmtime())
+    DOC['General'] = G
+    DOC['File_Location'] = 'working'
+
+    # The MediaInfo documents always had a Video and an Audio dictionary, even for audio only files
+    if proberFor(assetClass) == 'mediainfo':
+        DOC['Video'] = {}
+        DOC['Audio'] = {}
+    DOC.update(TRACKS)
+
+    # Run a small post processing for GPS. We need to turn lat/lon into a "location point" for elastic search indexing
+    try:
+        LOC = {'lat' : DOC['General']['Latitude'], 'lon' : DOC['General']['Longitude']}
+        DOC['General']['deviceLocation'] = LOC
+    except KeyError:
+        pass
+
+    for m in METADATA:
+        DOC[m] = METADATA[m]
+
+    return DOC
+
+
+def mediaSummary(DOC):
+
+    # The properties the activities after registerAsset decide on (e.g. transcodeVideoDefault remuxes a source that is
+    # already H.264 / AAC), so they don't need the whole document
+    SUMMARY = {
+        'container' : DOC.get('General', {}).get('format'),
+    }
+    for trackType in SUMMARY_FIELDS:
+        TRACK = DOC.get(trackType) or {}
+        SUMMARY['%sTracks' % (trackType.lower())] = 0
+        if not TRACK:
+            continue
+        SUMMARY['%sTracks' % (trackType.lower())] = 1 + len([key for key in TRACK if key.startswith('%s #' % (trackType))])
+        SUMMARY[trackType.lower()] = dict([(field, TRACK.get(field)) for field in SUMMARY_FIELDS[trackType]])
+
+    return SUMMARY
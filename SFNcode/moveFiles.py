@@ -5,11 +5,9 @@ author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
-import botocore
 import sys
 import os
+import errno
 import string
 import simplejson as json
 import time
@@ -21,149 +19,128 @@ sys.path.insert(0, '/Assets/sharedLibraries')
 import parseHelper
 import databaseHelper
 
-def main(args):
+import activityWorker
+import s3Helper
+
+DOMAIN = 'ITD'
+TASKNAME = 'moveFiles'
 
-    DOMAIN = 'ITD'
-    VERSION = '1'
+workingStorage = "/Assets/working/"
 
-    taskName = os.path.basename(__file__)[:-3]
+# S3 copies are network bound
+POLLERS = 1
+WORKERS = 4
+
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
-    logging.debug("Creating SWF boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    swf = boto3.client('swf', config=botoConfig)
-    logging.debug("Created SWF boto client: %s", swf)
 
-    BUCKETNAME = "schulerfiles"
-    workingStorage = "/Assets/working/"
+    worker = createWorker()
+    worker.run()
+
 
-    while True:
+def createWorker(client=None):
 
-        task = swf.poll_for_activity_task(
-            domain=DOMAIN,
-            taskList={'name': taskName},
-            identity='%s-01' %(taskName)
-        )
+    return activityWorker.ActivityWorker(TASKNAME, processTask, domain=DOMAIN, pollers=POLLERS, workers=WORKERS, client=client)
 
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
+    
+    source = INPUT['locationSource']
+    destination = INPUT['locationDestination']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+    fileKey = INPUT['fileKey'] + '/'
+    
+    # Setting the storage class to be used for later
+    s3StorageClass = 'STANDARD'
+    if destination == 'near_line':
+        s3StorageClass = 'STANDARD_IA'
+    
+    logging.info("[%s] Moving %s from %s to %s", workID, fileKey, source, destination)
+    # CDN and near_line are both S3 tiers, so all we are doing is changing the Storage Class with a PUT
+    if (source == 'CDN' and destination == 'near_line') or (source == 'near_line' and destination == 'CDN'):
+    
+        logging.info("[%s] Moving objects between S3 and S3IA", workID)
+        # Every object is copied unless the request asks to skip the ones already in the target class (e.g. a re-run)
+        STATS = s3Helper.transitionPrefix(fileKey, s3StorageClass, workID, skipExisting=INPUT.get('skipExisting', False))
+
+        # Keep the location as it is if anything did not move, so the move can be re-run
+        if STATS['failed']:
+            result = {
+                'reason' : 'MOV-0001_Error moving files from %s to %s' % (source, destination),
+                'detail' : json.dumps(dict(STATS, failed=s3Helper.summarizeFailures(STATS['failed'])))
+            }
+            raise activityWorker.TaskFailure(result)
+
+        OUTPUT = {
+            'result' : 'success',
+            'transition' : STATS,
+        }
+    
+    # If we need to move to or restore from archive, we need to run the whole gamut
+    elif 'archive' in [source, destination]: #Glacier
+        
+        # Create Glacier object
         
-        # Run the operation
+        
+        # Create directory in working storage
+        subDir = parseHelper.createDir(workingStorage, fileKey)
+    
+        # Pull down from glacier
+        if source == 'archive':
+            logging.info("[%s] Moving asset from Glacier", workID)
         else:
-            taskToken = task['taskToken']
-            workID = task['workflowExecution']['workflowId']
-            logging.info("[%s] New request for %s", workID, taskName)
-
-            INPUT = json.loads(task['input'])
-            
-            source = INPUT['locationSource']
-            destination = INPUT['locationDestination']
-            dbPrimaryKey = INPUT['dbPrimaryKey']
-            fileKey = INPUT['fileKey'] + '/'
-            
-            # Bucket object is necessary in all cases
-            logging.debug("[%s] Creating S3 bucket boto client", workID)
-            s3 = boto3.resource('s3')
-            bucket = s3.Bucket(BUCKETNAME)
-            logging.debug("[%s] Created S3 bucket boto client", workID)
-            
-            # Setting the storage class to be used for later
-            s3StorageClass = 'STANDARD'
-            if destination == 'near_line':
-                s3StorageClass = 'STANDARD_IA'
-            
-            logging.info("[%s] Moving %s from %s to %s", workID, fileKey, source, destination)
-            # CDN and near_line are both S3 tiers, so all we are doing is changing the Storage Class with a PUT
-            if (source == 'CDN' and destination == 'near_line') or (source == 'near_line' and destination == 'CDN'):
-            
-                logging.info("[%s] Moving objects between S3 and S3IA", workID)
-                for obj in bucket.objects.filter(Prefix=fileKey):
-                    logging.debug("[%s] Moving object %s from %s to %s object: ", workID, obj.key, source, destination)
-                    
-                    copy_source = {
-                        'Bucket' : bucket.name,
-                        'Key' : obj.key
-                    }
-                    
-                    response = s3.meta.client.copy_object(
-                        CopySource=copy_source, 
-                        Bucket=bucket.name,
-                        Key=obj.key, 
-                        StorageClass=s3StorageClass
-                        )
-                    logging.debug("[%s] Object moved: ", workID, response)
-                    
-                OUTPUT = {
-                    'result' : 'success',
-                }
-            
-            # If we need to move to or restore from archive, we need to run the whole gamut
-            elif 'archive' in [source, destination]: #Glacier
+            logging.info("[%s] Begin moving objects to Glacier", workID)
+            logging.info("[%s] Begin object download", workID)
+            # Download object to the working storage subdirectory
+            # Upload files back up to the same fileKey (this takes Accounts into consideration as well)
+            for obj in s3Helper.listObjects(fileKey):
+                logging.info("[%s] Downloading %s to temporary storage", workID, obj['Key'])
+                fileName = os.path.join(workingStorage,obj['Key'])
+                if not os.path.exists(os.path.dirname(fileName)):
+                    try:
+                        os.makedirs(os.path.dirname(fileName))
+                    except OSError as exc: # Guard against race condition
+                        if exc.errno != errno.EEXIST:
+                            raise
                 
-                # Create Glacier object
+                s3Helper.getClient().download_file(s3Helper.BUCKETNAME, obj['Key'], fileName) # Create directories as needed here
                 
-                
-                # Create directory in working storage
-                subDir = parseHelper.createDir(workingStorage, fileKey)
-            
-                # Pull down from glacier
-                if source == 'archive':
-                    logging.info("[%s] Moving asset from Glacier", workID)
-                else:
-                    logging.info("[%s] Begin moving objects to Glacier", workID)
-                    logging.info("[%s] Begin object download", workID)
-                    # Download object to the working storage subdirectory
-                    # Upload files back up to the same fileKey (this takes Accounts into consideration as well)
-                    for obj in bucket.objects.filter(Prefix=fileKey):
-                        logging.info("[%s] Downloading %s to temporary storage", workID, obj.key)
-                        fileName = os.path.join(workingStorage,obj.key)
-                        if not os.path.exists(os.path.dirname(fileName)):
-                            try:
-                                os.makedirs(os.path.dirname(fileName))
-                            except OSError as exc: # Guard against race condition
-                                if exc.errno != errno.EEXIST:
-                                    raise
-                        
-                        s3.Object(bucket.name, obj.key).download_file(fileName) # Create directories as needed here
-                        
-                    
-                    logging.info("[%s] Begin object upload to glacier", workID)
-                
-                # Output needs the temporary storage location to clean up
-                # cleanUpLandingPads expects an ASSET (e.g., /Assets/working/file.ext), and not just a path. We will provide a dummy asset
-                OUTPUT = {
-                    'result' : 'success',
-                    'asset' : '%sdummy.file' % (subDir)
-                }
-            
-            AUDIT = {}
-            AUDIT['User'] = 'System'
-            AUDIT['Timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000",time.gmtime())
-            AUDIT['Action'] = 'Asset moved from %s from %s' % (source, destination)
-            AUDIT['Notes'] = workID
             
-            # Add the Audit Dictionary to a list so that we can append it
-            aLIST = []
-            aLIST.append(AUDIT)
+            logging.info("[%s] Begin object upload to glacier", workID)
+        
+        # Output needs the temporary storage location to clean up
+        # cleanUpLandingPads expects an ASSET (e.g., /Assets/working/file.ext), and not just a path. We will provide a dummy asset
+        OUTPUT = {
+            'result' : 'success',
+            'asset' : '%sdummy.file' % (subDir)
+        }
     
-            updateExpression = 'set File_Location = :d, Audit = list_append(Audit, :a)'
-            
-            expressionValues = {
-                ':d' : destination,
-                ':a' : aLIST
-            }
-            # Call the update function
-            logging.debug("[%s] Updating the asset location and history: %s", workID, destination)
-            response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)       
-            
-            OUTPUT.update(INPUT)
-
-            swf.respond_activity_task_completed(
-                taskToken = taskToken,
-                result = json.dumps(OUTPUT)
-            )
-                    
-            logging.info("[%s] %s Complete", workID, taskName)
+    AUDIT = {}
+    AUDIT['User'] = 'System'
+    AUDIT['Timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000",time.gmtime())
+    AUDIT['Action'] = 'Asset moved from %s from %s' % (source, destination)
+    AUDIT['Notes'] = workID
+    
+    # Add the Audit Dictionary to a list so that we can append it
+    aLIST = []
+    aLIST.append(AUDIT)
+
+    updateExpression = 'set File_Location = :d, Audit = list_append(Audit, :a)'
+    
+    expressionValues = {
+        ':d' : destination,
+        ':a' : aLIST
+    }
+    # Call the update function
+    logging.debug("[%s] Updating the asset location and history: %s", workID, destination)
+    response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)       
+    
+    OUTPUT.update(INPUT)
+
+    return OUTPUT
 
 if __name__ == '__main__':
     
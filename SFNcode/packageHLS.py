@@ -0,0 +1,193 @@
+""" This function packages a video as adaptive bitrate HLS and registers the master playlist with the DB
+
+Function will take the following steps:
+    Create an hls directory
+    Utilize FFMPEG to encode every rung of the ladder in a single run
+        The video is decoded once and split into one scaler and encoder per rung
+        Every rung is cut into fMP4 segments at the same keyframes, so players can switch between them at any segment
+    Write a master playlist that lists the rungs
+    Update the database entry with the HLS master playlist, next to the PDL
+    Return success or failure
+
+The PDL (transcodeVideoDefault) is still created for downloads and for players without HLS support.
+
+"""
+
+import sys
+import os
+import subprocess
+import string
+import time
+import simplejson as json
+import multiprocessing
+
+import logging
+import logging.config
+
+sys.path.insert(0, '/Assets/sharedLibraries')
+import parseHelper
+import databaseHelper
+
+import activityWorker
+import ffmpegHelper
+
+
+ARN = "arn:aws:states:us-east-1:497940546915:activity:packageHLS"
+TASKNAME = 'packageHLS'
+
+# One ffmpeg runs an encoder per rung, so this is as heavy as the transcode
+POLLERS = 1
+WORKERS = max(1, multiprocessing.cpu_count() / 4)
+
+# (short side, video bitrate, max rate, buffer size) of each rung. Rungs above the short side of the source are left out
+# The short side is the height of a landscape video and the width of a portrait one, so a 720p rung is 1280x720 or 720x1280
+LADDER = [
+    (360, '800k', '856k', '1200k'),
+    (720, '2800k', '2996k', '4200k'),
+    (1080, '5000k', '5350k', '7500k'),
+]
+AUDIO_BITRATE = '128k'
+# Length of a segment, in seconds. Every rung has a keyframe at each segment boundary
+SEGMENT_SECONDS = 6
+
+def main(args):
+
+    logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
+
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, arn=ARN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
+    asset = INPUT['asset']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+
+    # Re-upload of a deleted asset whose HLS rendition is still in S3 (see dedupHelper)
+    REUSE = INPUT.get('reuse', {})
+    if 'HLS' in REUSE:
+        logging.info("[%s] Reusing the existing HLS rendition", workID)
+        OUTPUT = {
+            'tool' : '',
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'],
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        return OUTPUT
+
+    newDir = "hls"
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    subDir = parseHelper.createDir(filePath, newDir)
+
+    # Every file is written flat into the hls directory, distributeToS3 keeps only the last directory of a path
+    master = '%s_master.m3u8' % (fileName)
+
+    try:
+        startTime = time.time()
+        duration = ffmpegHelper.probeDuration(asset)
+        cmd = buildPackageCommand(asset, subDir, fileName, master)
+
+        # Progress of the encode is sent as the task heartbeat, a stalled ffmpeg runs into the heartbeat timeout
+        logging.debug("[%s] Execute HLS packaging: %s", workID, cmd)
+        output = ffmpegHelper.runParallel([cmd], 1, task.get('heartbeat'), duration)
+
+        STATS = ffmpegHelper.throughput(duration, time.time() - startTime)
+        logging.info("[%s] Packaged %s seconds of video in %.1f seconds", workID, duration, STATS['seconds'])
+
+        logging.debug("[%s] Update HLS value", workID)
+        updateExpression = 'set HLS = :h'
+
+        expressionValues = {
+            ':h' : '/%s/%s' %(newDir, master),
+        }
+
+        response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
+
+        OUTPUT = {
+            'tool' : output,
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'],
+            'asset' : asset,
+            'reuse' : REUSE,
+            'throughput' : STATS,
+        }
+
+        return OUTPUT
+
+    # We should catch other errors here
+    except subprocess.CalledProcessError as err:
+
+        result = {
+            'reason' : 'TRC-0002_Error in HLS packaging',
+            'detail' : str(err)
+        }
+        raise activityWorker.TaskFailure(result)
+
+def buildPackageCommand(asset, subDir, fileName, master):
+
+    # Rungs up to the short side of the source, and at least the lowest one
+    width, height = ffmpegHelper.probeDimensions(asset)
+    RUNGS = [rung for rung in LADDER if rung[0] <= min(width, height)] or LADDER[:1]
+    audio = ffmpegHelper.hasAudio(asset)
+
+    # [0:v]split=3[s0][s1][s2];[s0]scale=-2:360[v0];[s1]scale=-2:720[v1];[s2]scale=-2:1080[v2]
+    # Portrait sources (as displayed, after their rotation, see probeDimensions) are scaled on the width instead: [s0]scale=360:-2[v0];...
+    scale = '%d:-2' if height > width else '-2:%d'
+    FILTERS = ['[0:v]split=%d%s' % (len(RUNGS), ''.join(['[s%d]' % (i) for i in range(len(RUNGS))]))]
+    for (i, rung) in enumerate(RUNGS):
+        FILTERS.append('[s%d]scale=%s[v%d]' % (i, scale % (rung[0]), i))
+
+    cmd = ['ffmpeg'
+        ,'-y'
+        ,'-i', asset
+        ,'-filter_complex', ';'.join(FILTERS)
+    ]
+
+    STREAMS = []
+    for (i, (rungSize, bitrate, maxrate, bufsize)) in enumerate(RUNGS):
+        cmd.extend(['-map', '[v%d]' % (i)
+            ,'-b:v:%d' % (i), bitrate
+            ,'-maxrate:v:%d' % (i), maxrate
+            ,'-bufsize:v:%d' % (i), bufsize
+        ])
+        if audio:
+            # var_stream_map needs an audio stream of its own for each rung
+            cmd.extend(['-map', '0:a:0'])
+            STREAMS.append('v:%d,a:%d,name:%dp' % (i, i, rungSize))
+        else:
+            STREAMS.append('v:%d,name:%dp' % (i, rungSize))
+
+    cmd.extend(['-c:v', 'libx264'
+        ,'-preset', 'fast'
+        ,'-sc_threshold', '0'
+        ,'-force_key_frames', 'expr:gte(t,n_forced*%d)' % (SEGMENT_SECONDS)
+    ])
+    if audio:
+        cmd.extend(['-c:a', 'aac', '-b:a', AUDIO_BITRATE])
+
+    # %v is replaced with the name of the rung in every file name
+    cmd.extend(['-f', 'hls'
+        ,'-hls_time', str(SEGMENT_SECONDS)
+        ,'-hls_playlist_type', 'vod'
+        ,'-hls_segment_type', 'fmp4'
+        ,'-hls_flags', 'independent_segments'
+        ,'-hls_fmp4_init_filename', '%s_%%v_init.mp4' % (fileName)
+        ,'-hls_segment_filename', '%s/%s_%%v_%%d.m4s' % (subDir, fileName)
+        ,'-master_pl_name', master
+        ,'-var_stream_map', ' '.join(STREAMS)
+        ,'-loglevel', 'fatal'
+        ,'%s/%s_%%v.m3u8' % (subDir, fileName)
+    ])
+
+    return cmd
+
+if __name__ == '__main__':
+
+    main(sys.argv)
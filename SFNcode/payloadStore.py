@@ -0,0 +1,105 @@
+""" Claim check for large values passed between activities
+
+Step Functions and SWF cap task inputs and results at 32 KB, and every hop serializes and parses the whole payload again.
+The metadata DOC of a media file (every EXIF / MediaInfo field) can get close to that on its own.
+
+offload writes a large value to the payload store and returns a small reference in its place:
+    {'$payload' : 'file:///Assets/working/payloads/<checksum>_<workID>_DOC.json'}  (local store, on the shared /Assets volume)
+    {'$payload' : 's3://schulerfiles/payloads/<checksum>_<workID>_DOC.json'}       (S3 store)
+Only the activity that needs the value calls resolve. Values under the threshold pass through unchanged, as the JSON
+offload already produced (simplejson.RawJSON), so the activity output doesn't serialize them a second time.
+
+Functions:
+    offload -- stores a value over the threshold and returns its reference
+    resolve -- returns the value behind a reference (or the value itself)
+    discard -- removes a stored value once it has been consumed
+
+"""
+
+import os
+import simplejson as json
+
+import logging
+
+import s3Helper
+
+# Serialized size above which a value is stored instead of passed
+PAYLOAD_THRESHOLD = 16 * 1024
+
+# 'local' keeps the payloads on the shared /Assets volume, 's3' in the bucket
+PAYLOAD_STORE = 'local'
+LOCAL_ROOT = '/Assets/working/payloads'
+S3_PREFIX = 'payloads'
+
+REFERENCE = '$payload'
+
+
+def isReference(value):
+
+    return isinstance(value, dict) and REFERENCE in value
+
+
+def offload(value, key):
+
+    # key must be unique to the value and to the execution, e.g. the asset checksum, the work ID and the name of the field
+    # A key shared by two executions (the same file ingested twice at once) would let one discard what the other still resolves
+    # The value is serialized once: the same string is measured, stored, or embedded in the output as it is
+    data = json.dumps(value, use_decimal=True)
+    if len(data) <= PAYLOAD_THRESHOLD:
+        return json.RawJSON(data)
+
+    name = '%s.json' % (key)
+    if PAYLOAD_STORE == 's3':
+        s3Key = '%s/%s' % (S3_PREFIX, name)
+        s3Helper.getClient().put_object(Bucket=s3Helper.BUCKETNAME, Key=s3Key, Body=data, ServerSideEncryption='AES256')
+        location = 's3://%s/%s' % (s3Helper.BUCKETNAME, s3Key)
+    else:
+        if not os.path.isdir(LOCAL_ROOT):
+            try:
+                os.makedirs(LOCAL_ROOT)
+            except OSError:
+                # Another worker created it first
+                pass
+        path = os.path.join(LOCAL_ROOT, name)
+        # Written under a temporary name so that a reader never sees half a file
+        with open(path + '.tmp', 'w') as f:
+            f.write(data)
+        os.rename(path + '.tmp', path)
+        location = 'file://%s' % (path)
+
+    logging.debug("Offloaded %d bytes to %s", len(data), location)
+
+    return {REFERENCE : location}
+
+
+def resolve(value):
+
+    if not isReference(value):
+        return value
+
+    location = value[REFERENCE]
+    if location.startswith('s3://'):
+        (bucket, s3Key) = location[len('s3://'):].split('/', 1)
+        data = s3Helper.getClient().get_object(Bucket=bucket, Key=s3Key)['Body'].read()
+    else:
+        with open(location[len('file://'):]) as f:
+            data = f.read()
+
+    # Parsing with decimals, as floats are not permitted by dynamoDB
+    return json.loads(data, use_decimal=True)
+
+
+def discard(value):
+
+    if not isReference(value):
+        return
+
+    location = value[REFERENCE]
+    try:
+        if location.startswith('s3://'):
+            (bucket, s3Key) = location[len('s3://'):].split('/', 1)
+            s3Helper.getClient().delete_object(Bucket=bucket, Key=s3Key)
+        else:
+            os.remove(location[len('file://'):])
+    except Exception as err:
+        logging.warning("Could not remove payload %s: %s", location, str(err))
@@ -4,8 +4,7 @@ author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
+from boto3.dynamodb.types import TypeSerializer
 import sys
 import os
 import simplejson as json
@@ -16,139 +15,175 @@ import logging.config
 sys.path.insert(0, '/Assets/sharedLibraries/')
 import databaseHelper
 
+import activityWorker
+import dedupHelper
+import geocodeHelper
+import payloadStore
+
+ARN = "arn:aws:states:us-east-1:497940546915:activity:registerAsset"
+TASKNAME = 'registerAsset'
+
+# Database writes are network bound
+POLLERS = 2
+WORKERS = 8
+
+TABLENAME = 'Assets'
 
 def main(args):
 
-    ARN = "arn:aws:states:us-east-1:497940546915:activity:registerAsset"
-    taskName = os.path.basename(__file__)[:-3]
-    
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
 
-    logging.debug("Creating SFN boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    sfn = boto3.client('stepfunctions', config=botoConfig)
-    logging.debug("Created SFN boto client: %s", sfn)
-    
-    while True:
+    worker = createWorker()
+    worker.run()
 
-        task = sfn.get_activity_task(
-            activityArn=ARN,
-            workerName='%s-01' %(taskName)
-        )
 
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, arn=ARN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'] , use_decimal=True)
+    # Large documents are passed by reference (see payloadStore)
+    DOC = payloadStore.resolve(INPUT['DOC'])
+    registered = True
+
+    # The database helper class has all we need CRUD operations
+    logging.debug("[%s] Writing database entry", workID)
+    
+    # This is where we write the entry. Note that we use the CHECKSUM as a primary key
+    # Registration WILL fail if the same file exists
+    # There are two options if the registration fails
+    #   1. Someone uploaded a previously deleted file. If this is the case, use a contional update on:
+    #       FILENAME 
+    #       LOCATION
+    #       USER
+    #       Audit trail
+    #   2. Else, fail
+    # NOTE: Should we tie the index to account as well?
+    
+    # boto3 resources are not thread safe, every worker shares the low level client of the process instead
+    client = activityWorker.getClient('dynamodb')
+    serializer = TypeSerializer()
+
+    try:
+        client.put_item(
+            TableName = TABLENAME,
+            Item = serialize(serializer, DOC),
+            ConditionExpression = 'attribute_not_exists(Checksum)'
+        )
+        addAddress(DOC, workID)
+    
+    # ConditionalCheckFailedException
+    except botocore.exceptions.ClientError as err:
+    
+        # FUTURE: Grep for ConditionalCheckFailedException
+        # We need to separate out actual client errors from put item errors
+        logging.debug("[%s] Entry already exists for: %s", workID, DOC['Checksum'])
+
+        # Update the document. Set the PDL and thumbnail as NULL as well
+        key = {
+            'Checksum' : {'S' : DOC['Checksum']},
+            }
         
-        # Run the operation
-        else:
+        # Derivatives that the extract activity found in S3 (dedupHelper.checkDuplicate) are kept, the others are removed and created again
+        REUSE = INPUT.get('reuse', {})
+        REMOVE = [name for name in dedupHelper.DERIVATIVES if name not in REUSE]
+        updateExpression = 'SET File_Location = :d, Filename = :f, UserFields = :u, Audit = list_append(Audit, :a)'
+        for name in REUSE:
+            updateExpression = updateExpression + ', %s = :%s' % (name, name)
+        if REMOVE:
+            updateExpression = updateExpression + ' REMOVE %s' % (', '.join(REMOVE))
+        conditionalExpression = 'File_Location = :l'
         
-            taskToken = task['taskToken']
-            workID = task['ResponseMetadata']['RequestId']
-            logging.info("[%s] New request for %s", workID, taskName)
-            INPUT = json.loads(task['input'] , use_decimal=True)
-            DOC = INPUT['DOC']
-            registered = True
-
-            # The database helper class has all we need CRUD operations
-            logging.debug("[%s] Writing database entry", workID)
-            
-            # This is where we write the entry. Note that we use the CHECKSUM as a primary key
-            # Registration WILL fail if the same file exists
-            # There are two options if the registration fails
-            #   1. Someone uploaded a previously deleted file. If this is the case, use a contional update on:
-            #       FILENAME 
-            #       LOCATION
-            #       USER
-            #       Audit trail
-            #   2. Else, fail
-            # NOTE: Should we tie the index to account as well?
-            
-            dynamodb = boto3.resource('dynamodb')
-            table = dynamodb.Table('Assets')
-                
-            try:
-                table.put_item(
-                    Item = DOC,
-                    ConditionExpression = 'attribute_not_exists(Checksum)'
+        expressionValues = {
+            ':d' : 'working',
+            ':a' : DOC['Audit'],
+            ':u' : DOC['UserFields'],
+            ':f' : DOC['Filename'],
+            ':l' : 'delete'
+        }
+        for name in REUSE:
+            expressionValues[':%s' % (name)] = REUSE[name]
+        
+        logging.debug("[%s] Attempting to update the item if it is deleted", workID)
+        try:
+            result = client.update_item(
+                TableName = TABLENAME,
+                Key = key,
+                ConditionExpression = conditionalExpression,
+                UpdateExpression = updateExpression,
+                ExpressionAttributeValues = serialize(serializer, expressionValues),
+                ReturnValues = 'UPDATED_OLD'
                 )
             
-            # ConditionalCheckFailedException
-            except botocore.exceptions.ClientError as err:
+            logging.debug("[%s] Update result: %s", workID, result )
+        except botocore.exceptions.ClientError as err:
+            logging.debug("[%s] Update failed %s", workID, str(err) )
             
-                # FUTURE: Grep for ConditionalCheckFailedException
-                # We need to separate out actual client errors from put item errors
-                logging.debug("[%s] Entry already exists for: %s", workID, DOC['Checksum'])
-
-                # Update the document. Set the PDL and thumbnail as NULL as well
-                key = {
-                    'Checksum' : DOC['Checksum'],
-                    }
-                
-                updateExpression = 'SET File_Location = :d, Filename = :f, UserFields = :u, Audit = list_append(Audit, :a) REMOVE PDL, thumbnail, storyboard'
-                conditionalExpression = 'File_Location = :l'
-                
-                expressionValues = {
-                    ':d' : 'working',
-                    ':a' : DOC['Audit'],
-                    ':u' : DOC['UserFields'],
-                    ':f' : DOC['Filename'],
-                    ':l' : 'delete'
-                }
-                
-                logging.debug("[%s] Attempting to update the item if it is deleted", workID)
-                try:
-                    result = table.update_item(
-                        Key = key,
-                        ConditionExpression = conditionalExpression,
-                        UpdateExpression = updateExpression,
-                        ExpressionAttributeValues = expressionValues,
-                        ReturnValues = 'UPDATED_OLD'
-                        )
-                    
-                    logging.debug("[%s] Update result: %s", workID, result )
-                except botocore.exceptions.ClientError as err:
-                    logging.debug("[%s] Update failed %s", workID, str(err) )
-                    
-                    registered = False
-                    
-                    result = { 
-                        'reason' : 'REG-0001_Duplicate file entry: The file with ID %s already exists' %(DOC['Checksum']),
-                        'detail' : str(err)
-                    }
-
-
-            # Registered being TRUE indicates success
-            if registered:
-                
-                result = { 
-                    'Checksum' : DOC['Checksum'] 
-                }
-
-                OUTPUT = {
-                    'dbPrimaryKey' : result,
-                    'assetClass' : INPUT['assetClass'], 
-                    'asset' : INPUT['asset'],
-                }
-
-                
-                sfn.send_task_success(
-                    taskToken=taskToken,
-                    output=json.dumps(OUTPUT)
-                )
-            else:
+            registered = False
             
-                logging.warning("[%s] Registration failure: %s", workID, result)
-                sfn.send_task_failure(
-                    taskToken=taskToken,
-                    error=json.dumps(result['reason']),
-                    cause=json.dumps(result['detail'])
-                )
+            result = { 
+                'reason' : 'REG-0001_Duplicate file entry: The file with ID %s already exists' %(DOC['Checksum']),
+                'detail' : str(err)
+            }
+
+
+    # Registration is the last use of the DOC, also when it fails with REG-0001 (the workflow ends there)
+    payloadStore.discard(INPUT['DOC'])
+
+    # Registered being TRUE indicates success
+    if registered:
+
+        result = { 
+            'Checksum' : DOC['Checksum'] 
+        }
+
+        OUTPUT = {
+            'dbPrimaryKey' : result,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : INPUT['asset'],
+            'reuse' : INPUT.get('reuse', {}),
+            'media' : INPUT.get('media', {}),
+        }
+
+        
+        return OUTPUT
+    else:
+        raise activityWorker.TaskFailure(result)
+
+
+
+def serialize(serializer, VALUES):
+
+    # Python values (Decimal for numbers, see use_decimal) to the DynamoDB attribute values of the low level client
+    return dict([(name, serializer.serialize(value)) for (name, value) in VALUES.items()])
+
+
+def addAddress(DOC, workID):
+
+    # The extract activities only add the Address if the position was already cached (see geocodeHelper)
+    # Otherwise the address is written to the entry when the background lookup completes
+    G = DOC.get('General', {})
+    if 'Address' in G or 'Latitude' not in G or 'Longitude' not in G:
+        return
+
+    def update(address):
+        activityWorker.getClient('dynamodb').update_item(
+            TableName = TABLENAME,
+            Key = {'Checksum' : {'S' : DOC['Checksum']}},
+            ConditionExpression = 'attribute_exists(Checksum)',
+            UpdateExpression = 'SET General.Address = :a',
+            ExpressionAttributeValues = {':a' : {'S' : address}}
+            )
+        logging.debug("[%s] Added address to %s", workID, DOC['Checksum'])
+
+    address = geocodeHelper.lookup(G['Latitude'], G['Longitude'], update)
+    if address is not None:
+        update(address)
 
-            logging.info("[%s] %s Complete", workID, taskName)
 
-            
-            
-            
 if __name__ == '__main__':
     
     main(sys.argv)
\ No newline at end of file
@@ -1,5 +1,8 @@
 #!/bin/sh
 
+# All of the activities are hosted by a single activityHost.py process
+# Stopping sends SIGTERM so the host lets tasks in flight finish before it exits
+
 SCRIPTS=()
 
 SCRIPTS+=('identifyAssetClass.py')
@@ -9,20 +12,17 @@ SCRIPTS+=('extractMediainfoMetadata.py')
 SCRIPTS+=('createThumbnailFromImage.py')
 SCRIPTS+=('createThumbnailFromVideo.py')
 SCRIPTS+=('transcodeVideoDefault.py')
+SCRIPTS+=('packageHLS.py')
+SCRIPTS+=('transcodeAudioDefault.py')
 SCRIPTS+=('distributeToS3.py')
 SCRIPTS+=('cleanUpLandingPad.py')
 
+PIDFILE='activityHost.pid'
 
-for i in "${SCRIPTS[@]}"
-do
-	if [ "$1" == "start" ]; then 
-		python $i &
-	else
-		id=`ps u | grep "[p]ython ${i}"`
-		idA=($id)
-		`kill ${idA[1]}`
-	fi
-done
-
-
-
+if [ "$1" == "start" ]; then 
+	python activityHost.py "${SCRIPTS[@]%.py}" &
+	echo $! > $PIDFILE
+else
+	kill -TERM `cat $PIDFILE`
+	rm -f $PIDFILE
+fi
@@ -0,0 +1,155 @@
+""" Hosts every activity worker in a single process
+
+workflowJobs.sh used to start one Python interpreter per activity. Each one imported boto3, parsed the logging configuration
+and built its own clients, and they were stopped by grepping "ps" and killing the process, dropping any task in flight.
+
+The host:
+    Imports each activity module and builds its worker through the module's createWorker function
+    Shares one boto client per service between all of the workers
+    Checks the workers every few seconds and restarts any worker that lost a thread
+    Stops on SIGTERM or SIGINT: pollers finish their current poll and the tasks already started run to completion
+
+Usage: python activityHost.py [activity ...]
+    With no arguments the eleven ingest activities are hosted
+
+"""
+
+import sys
+import time
+import signal
+import threading
+import importlib
+
+import logging
+import logging.config
+
+import activityWorker
+
+# Same order as the ingest workflow
+ACTIVITIES = [
+    'identifyAssetClass',
+    'registerAsset',
+    'extractExifMetadata',
+    'extractMediainfoMetadata',
+    'createThumbnailFromImage',
+    'createThumbnailFromVideo',
+    'transcodeVideoDefault',
+    'packageHLS',
+    'transcodeAudioDefault',
+    'distributeToS3',
+    'cleanUpLandingPad',
+]
+
+# Seconds between health checks of the workers
+CHECK_INTERVAL = 5
+
+
+def main(args):
+
+    logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
+
+    names = args[1:]
+    if not names:
+        names = ACTIVITIES
+
+    host = ActivityHost(names)
+
+    def shutdown(signum, frame):
+        logging.info("Received signal %s, shutting down", signum)
+        host.stopping.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    host.run()
+
+
+class ActivityHost(object):
+
+    def __init__(self, names):
+
+        self.names = names
+        self.modules = {}
+        self.workers = {}
+        self.stopping = threading.Event()
+
+        for name in names:
+            logging.debug("Loading activity module: %s", name)
+            self.modules[name] = importlib.import_module(name)
+
+        # Every poller keeps a connection open for the length of its long-poll, and every worker needs one to respond
+        # Size the shared connection pools so that nobody waits on a connection
+        CONNECTIONS = {}
+        for name in names:
+            backend = self.backend(name)
+            module = self.modules[name]
+            CONNECTIONS[backend] = CONNECTIONS.get(backend, 0) + module.POLLERS + module.WORKERS
+
+        self.clients = {}
+        for (backend, connections) in CONNECTIONS.items():
+            self.clients[backend] = activityWorker.getClient(backend, maxPoolConnections=max(connections, 10))
+
+    def backend(self, name):
+
+        # Step Functions activities are addressed by ARN, SWF activities by domain and task list
+        if hasattr(self.modules[name], 'ARN'):
+            return 'stepfunctions'
+        return 'swf'
+
+    def startWorker(self, name):
+
+        worker = self.modules[name].createWorker(client=self.clients[self.backend(name)])
+        worker.start()
+        self.workers[name] = worker
+
+    def run(self):
+
+        for name in self.names:
+            self.startWorker(name)
+
+        logging.info("Hosting activities: %s", ', '.join(self.names))
+
+        # time.sleep is used instead of Event.wait so that signals are handled straight away
+        lastCheck = time.time()
+        while not self.stopping.is_set():
+            time.sleep(1)
+            if time.time() - lastCheck >= CHECK_INTERVAL:
+                self.check()
+                lastCheck = time.time()
+
+        self.stop()
+
+    def check(self):
+
+        for name in self.names:
+            worker = self.workers.get(name)
+            if worker is not None and worker.isAlive():
+                continue
+
+            logging.error("Activity %s lost a thread, restarting", name)
+            if worker is not None:
+                # The surviving threads of the old worker finish what they have in the background
+                retired = threading.Thread(target=worker.stop, name='%s-retire' % (name))
+                retired.daemon = True
+                retired.start()
+
+            try:
+                self.startWorker(name)
+            except Exception:
+                self.workers.pop(name, None)
+                logging.exception("Could not restart %s, retrying in %d seconds", name, CHECK_INTERVAL)
+
+    def stop(self):
+
+        # Let every poller finish its poll at the same time, then wait for the work in flight
+        for worker in self.workers.values():
+            worker.stopping.set()
+        for worker in self.workers.values():
+            worker.stop()
+
+        logging.info("All activities stopped")
+
+
+if __name__ == '__main__':
+
+    main(sys.argv)
@@ -0,0 +1,91 @@
+""" Single pass checksums of the assets on the landing pad
+
+parseHelper.computeChecksum read the whole asset before exiftool or MediaInfo read it a second time.
+For multi-GB videos on the EFS backed /Assets/upload that doubled the network I/O of the metadata activities.
+
+Here the asset is streamed once with large reads into a reused buffer and the SHA-1 (the Checksum of the asset record)
+is fed from it. The checksum runs in a background thread while the probe runs, so both read the file at the same time
+and the second reader is served from the page cache instead of the network. hashlib releases the GIL while it hashes.
+
+Functions:
+    computeChecksums -- streams the asset once and returns the SHA-1 and the hash throughput
+    startChecksums -- runs computeChecksums in a background thread, call result() on the returned thread to wait
+
+"""
+
+import hashlib
+import threading
+import time
+
+import logging
+
+MB = 1024 * 1024
+# Size of each read into the buffer. Large reads keep the number of round trips to EFS low
+READ_SIZE = 8 * MB
+
+
+def computeChecksums(asset):
+
+    # Returns a dictionary with sha1, plus bytes, seconds and bytesPerSecond
+    sha1 = hashlib.sha1()
+
+    buf = bytearray(READ_SIZE)
+    view = memoryview(buf)
+    size = 0
+    startTime = time.time()
+
+    # Unbuffered so that each read goes straight into buf
+    with open(asset, 'rb', 0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            size = size + n
+            sha1.update(chunk)
+
+    seconds = time.time() - startTime
+
+    RESULT = {
+        'sha1' : sha1.hexdigest(),
+        'bytes' : size,
+        'seconds' : round(seconds, 3),
+        'bytesPerSecond' : int(size / max(seconds, 0.001)),
+    }
+
+    logging.info("Checksum of %s: %d bytes in %.2f seconds (%.1f MB/s)", asset, size, seconds, RESULT['bytesPerSecond'] / float(MB))
+
+    return RESULT
+
+
+class ChecksumThread(threading.Thread):
+
+    def __init__(self, asset):
+
+        threading.Thread.__init__(self, name='checksum')
+        self.daemon = True
+        self.asset = asset
+        self.checksums = None
+        self.error = None
+
+    def run(self):
+
+        try:
+            self.checksums = computeChecksums(self.asset)
+        except Exception as err:
+            self.error = err
+
+    def result(self):
+
+        # Waits for the checksum and raises whatever computeChecksums raised
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.checksums
+
+
+def startChecksums(asset):
+
+    thread = ChecksumThread(asset)
+    thread.start()
+    return thread
@@ -5,16 +5,14 @@ Function will take the following steps:
     Utilize FFMPEG to create a thumbnail
         With a video, we want to take ~25% through a video just so it's not the beginning
     NOTE: Can we take full storyboard at some point?
-    Update the database entry with a Thumbnail section
+    Scale the renditions (thumbnailHelper.RENDITIONS) from the key frame
+    Update the database entry with a Thumbnail section and the rendition map
     Return success or failure
 
 author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
-import botocore
 import sys
 import os
 import subprocess
@@ -22,6 +20,8 @@ import string
 import simplejson as json
 import math
 import fnmatch
+import shutil
+import multiprocessing
 
 import logging
 import logging.config
@@ -30,180 +30,356 @@ sys.path.insert(0, '/Assets/sharedLibraries')
 import parseHelper
 import databaseHelper
 
+import activityWorker
+import ffmpegHelper
+import thumbnailHelper
 
 
-def main(args):
+DOMAIN = 'ITD'
+TASKNAME = 'createThumbnailFromVideo'
+
+# ffmpeg decodes the whole video, so keep this to a couple of jobs per host
+POLLERS = 1
+WORKERS = max(1, multiprocessing.cpu_count() / 4)
 
-    DOMAIN = 'ITD'
-    TASKLIST = 'default'
-    VERSION = '1'
+# full: decode every frame and keep one per second
+# keyframe: decode the keyframes only, spread over THUMBNAIL_PROCESSES ffmpeg processes
+THUMBNAIL_MODE = 'keyframe'
+THUMBNAIL_PROCESSES = 4
+KEYFRAME_MARGIN = 10 # seconds decoded past the end of each range, fewer numbers for fillThumbnailGaps to fill
 
-    taskName = os.path.basename(__file__)[:-3]
+# frames: one JPEG per thumbnail, each one its own cue in the VTT
+# sprite: thumbnails tiled into SPRITE_COLUMNS x SPRITE_ROWS sheets, cues point into a sheet with #xywh=
+STORYBOARD_FORMAT = 'frames'
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
-    logging.debug("Creating SWF boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    swf = boto3.client('swf', config=botoConfig)
-    logging.debug("Created SWF boto client: %s", swf)
+
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, domain=DOMAIN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
+    asset = INPUT['asset']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+
+    # Re-upload of a deleted asset whose thumbnail, storyboard and renditions are still in S3 (see dedupHelper)
+    REUSE = INPUT.get('reuse', {})
+    if 'thumbnail' in REUSE and 'storyboard' in REUSE and 'renditions' in REUSE:
+        logging.info("[%s] Reusing the existing thumbnail, storyboard and renditions", workID)
+        OUTPUT = {
+            'tool' : '',
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        return OUTPUT
+
+     # Take the thumbnail 25% through the video
+    
+    #scale = "640x360"
+    # Use the multipliers so that we don't distort vertical videos. This makes it generic. 
+    scale = "iw/3:ih/3"  # 1/3 gives 1920 (HD) down to 640
+    fps = 1 # Set the number of frames to be once per second
+    newDir = "thumbnails"
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    subDir = parseHelper.createDir(filePath, newDir)
+    
+    # We require the %d to keep the file names incremented
+    # Note that we need to escape the percentage sign by using another %, hence the double %
+    outfile = '%s_thumbnail_%%d.jpg' % (fileName)
+    vtt = '%s.vtt' % (fileName)
     
-    while True:
-
-        task = swf.poll_for_activity_task(
-            domain=DOMAIN,
-            taskList={'name': taskName},
-            identity='%s-01' %(taskName)
-        )
-
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
-        
-        # Run the operation
-        else:
-            taskToken = task['taskToken']
-            workID = task['workflowExecution']['workflowId']
-            logging.info("[%s] New request for %s", workID, taskName)
-
-            INPUT = json.loads(task['input'])
-            asset = INPUT['asset']
-            dbPrimaryKey = INPUT['dbPrimaryKey']
-             # Take the thumbnail 25% through the video
+    # The mode can be picked per request, otherwise the module default is used
+    thumbnailMode = INPUT.get('thumbnailMode', THUMBNAIL_MODE)
+    storyboardFormat = INPUT.get('storyboardFormat', STORYBOARD_FORMAT)
+
+    # Progress of every ffmpeg run is sent as the task heartbeat, a stalled ffmpeg runs into the heartbeat timeout
+    # The steps in between report themselves (reportStep), so a long video does not run out of HeartbeatSeconds after the decode
+    heartbeat = task.get('heartbeat')
+
+    try:
+        cmds = buildThumbnailCommands(asset, '%s/%s' %(subDir, outfile), fps, scale, thumbnailMode)
+
+        logging.debug("[%s] Execute video thumbnail creation: %s", workID, cmds)
+        output = ffmpegHelper.runParallel(cmds, THUMBNAIL_PROCESSES, heartbeat)
+        if len(cmds) > 1:
+            reportStep(heartbeat, 'gaps')
+            fillThumbnailGaps(subDir, fileName)
+        
+        # Start setting the parameters needed to update the thumbnail
+        
+        # Comment block is staying for reference sake
+        '''# Call the update function
+        # The "thumbnails" map will need to be created if it doesn't exist (Note: It shouldn't at this point)
+        # A validation exception will be thrown, and when this is thrown, we will create an empty map and try it again
+        try:
+            response = databaseHelper.updateEntry(key, updateExpression, expressionValues) 
+        
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] == 'ValidationException':
+                
+                
+                response = databaseHelper.updateEntry(key, 'set thumbnails = :t', {':t' : {}})
+                response = databaseHelper.updateEntry(key, updateExpression, expressionValues)
+        '''
+        
+        # After the thumbnails are created, we need to do two things:
+        # OLD # 1. Create the storyboard object which is [http://docs.brightcove.com/en/perform/brightcove-player/guides/thumbnails-plugin.html#collectimages]
+        # 1. Create the storyboard VTT file (https://support.jwplayer.com/customer/portal/articles/1407439-adding-preview-thumbnails)
+        # 2. We also need to identify the thumbnail for the video which we will take a percentage of the way through the video
+
+        
+        #STORYBOARD = {}
+        thumbnailTime = .25 # Pick the thumbnail that's 25% of the way through the video
+        counter = 0
+        
+        for thumb in os.listdir(subDir):
+            if fnmatch.fnmatch(thumb, '*_thumbnail_*.jpg'): # Match files in the directory that are the thumbnails
+                #sequenceNum = thumb[thumb.rfind('_')+1:-4] # filename_thumbnail_$frame.jpg
+                #STORYBOARD[sequenceNum] = {'src' : '/%s/%s' %(newDir, thumb) }
+                counter = counter + 1
+
+        # Thumbnails are numbered from 1, a clip with fewer than 4 of them gets the first one
+        index = str(max(1, math.trunc(counter * thumbnailTime)))
+        logging.debug("[%s] Key frame identified in index: %s", workID, index)
+
+        # Tile the thumbnails into sheets. Only the sheets and the key frame are kept, which cuts the number of objects
+        # distributeToS3 has to upload (and the CDN has to serve) by SPRITE_COLUMNS x SPRITE_ROWS
+        if storyboardFormat == 'sprite' and counter > 0:
+            logging.debug("[%s] Building storyboard sprite sheets", workID)
+            thumbWidth, thumbHeight = ffmpegHelper.probeDimensions('%s/%s_thumbnail_1.jpg' % (subDir, fileName))
+            output = output + buildSpriteSheets(subDir, fileName, heartbeat)
+
+            reportStep(heartbeat, 'cleanup')
+            for i in range(0,counter):
+                if str(i + 1) != index:
+                    os.remove('%s/%s_thumbnail_%d.jpg' % (subDir, fileName, i + 1))
+
+        # Open the VTT file and write
+        reportStep(heartbeat, 'storyboard')
+        logging.debug("[%s] Writing VTT file: %s", workID, vtt)
+        vttFile = open('%s/%s' %(subDir, vtt), 'w')
+        vttFile.write("WEBVTT")
+        # The counter represents how many files of FPS we have -- range is COUNTER*FPS --> (COUNTER+1)* fps
+        # FPS references the frames per second so if we put (1/60), that means a frame EVERY MINUTE
+        # Therefore, we need to invest the FPS
+        # Use %02d to PAD the numbers 
+        
+        baseURL = "https://dnt4vq51jg2tj.cloudfront.net" # There needs to be a better way then the full URL
+        for i in range(0,counter):
+            startSecond = i * (1/fps)
+            endSecond = (i + 1) * (1/fps)
+            startSpan = '%02d:%02d:%02d.000' % ( startSecond / 3600, startSecond / 60 % 60, startSecond % 60) 
+            endSpan =  '%02d:%02d:%02d.000' % ( endSecond / 3600, endSecond / 60 % 60, endSecond % 60)
             
-            #scale = "640x360"
-            # Use the multipliers so that we don't distort vertical videos. This makes it generic. 
-            scale = "iw/3:ih/3"  # 1/3 gives 1920 (HD) down to 640
-            fps = 1 # Set the number of frames to be once per second
-            newDir = "thumbnails"
-            (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
-            subDir = parseHelper.createDir(filePath, newDir)
             
-            # We require the %d to keep the file names incremented
-            # Note that we need to escape the percentage sign by using another %, hence the double %
-            outfile = '%s_thumbnail_%%d.jpg' % (fileName)
-            vtt = '%s.vtt' % (fileName)
+            if storyboardFormat == 'sprite':
+                # Sheets are numbered from 1, thumbnails fill each sheet row by row
+                sheet = i / (SPRITE_COLUMNS * SPRITE_ROWS) + 1
+                position = i % (SPRITE_COLUMNS * SPRITE_ROWS)
+                x = (position % SPRITE_COLUMNS) * thumbWidth
+                y = (position / SPRITE_COLUMNS) * thumbHeight
+                thumbSpan =  '%s/%s/%s/%s_storyboard_%d.jpg#xywh=%d,%d,%d,%d' % (baseURL, fileName, newDir, fileName, sheet, x, y, thumbWidth, thumbHeight)
+            else:
+                thumbSpan =  '%s/%s/%s/%s_thumbnail_%d.jpg' % (baseURL, fileName, newDir, fileName,i + 1)
             
-            # Parameters are
-            # -y for
-            # -i for Input
-            # -vf, fps=1,scale= for the video filter stating we want to take every one second
-            cmd = ['ffmpeg'
-                ,'-y'
-                ,'-i', asset
-                ,'-vf', 'fps=%s,scale=%s' %(fps, scale)
-                ,'-loglevel', 'fatal'
-                ,'%s/%s' %(subDir, outfile)
-            ]
-
-            logging.debug("[%s] Execute video thumbnail creation: %s", workID, cmd)
+            vttFile.write("\n\n%s --> %s\n%s" % (startSpan, endSpan, thumbSpan))
+        
+        vttFile.close()
+        logging.debug("[%s] Wrote VTT file: %s", workID, vtt)
+        
+        # The renditions are scaled from the key frame, the only frame the UI shows outside of the player
+        # The thumbnails are 1/3 of the video size, so the key frame is extracted again at full size for them
+        RENDITIONMAP = {}
+        if counter > 0:
+            keyframe = '%s/%s_keyframe.jpg' % (filePath, fileName)
             try:
-                output = subprocess.check_output(cmd)
-                
-                # Start setting the parameters needed to update the thumbnail
-                
-                # Comment block is staying for reference sake
-                '''# Call the update function
-                # The "thumbnails" map will need to be created if it doesn't exist (Note: It shouldn't at this point)
-                # A validation exception will be thrown, and when this is thrown, we will create an empty map and try it again
+                output = output + extractKeyFrame(asset, keyframe, max(0.0, (int(index) - 1) / float(fps)), heartbeat)
+                keyWidth, keyHeight = ffmpegHelper.probeDimensions(keyframe)
+                RENDITIONOUTPUTS, RENDITIONMAP = thumbnailHelper.renditionOutputs(subDir, newDir, fileName
+                    , INPUT.get('renditions', thumbnailHelper.RENDITIONS)
+                    , INPUT.get('renditionFormats', thumbnailHelper.RENDITION_FORMATS)
+                    , keyWidth)
+                if RENDITIONOUTPUTS:
+                    reportStep(heartbeat, 'renditions')
+                    logging.debug("[%s] Execute rendition creation: %s", workID, RENDITIONOUTPUTS)
+                    output = output + thumbnailHelper.createThumbnails(keyframe, RENDITIONOUTPUTS)
+            finally:
+                # The full size frame is not distributed
                 try:
-                    response = databaseHelper.updateEntry(key, updateExpression, expressionValues) 
-                
-                except botocore.exceptions.ClientError as err:
-                    if err.response['Error']['Code'] == 'ValidationException':
-                        
-                        
-                        response = databaseHelper.updateEntry(key, 'set thumbnails = :t', {':t' : {}})
-                        response = databaseHelper.updateEntry(key, updateExpression, expressionValues)
-                '''
-                
-                # After the thumbnails are created, we need to do two things:
-                # OLD # 1. Create the storyboard object which is [http://docs.brightcove.com/en/perform/brightcove-player/guides/thumbnails-plugin.html#collectimages]
-                # 1. Create the storyboard VTT file (https://support.jwplayer.com/customer/portal/articles/1407439-adding-preview-thumbnails)
-                # 2. We also need to identify the thumbnail for the video which we will take a percentage of the way through the video
+                    os.remove(keyframe)
+                except OSError:
+                    pass
 
-                
-                #STORYBOARD = {}
-                thumbnailTime = .25 # Pick the thumbnail that's 25% of the way through the video
-                counter = 0
-                
-                for thumb in os.listdir(subDir):
-                    if fnmatch.fnmatch(thumb, '*_thumbnail_*.jpg'): # Match files in the directory that are the thumbnails
-                        #sequenceNum = thumb[thumb.rfind('_')+1:-4] # filename_thumbnail_$frame.jpg
-                        #STORYBOARD[sequenceNum] = {'src' : '/%s/%s' %(newDir, thumb) }
-                        counter = counter + 1
-
-                # Open the VTT file and write
-                logging.debug("[%s] Writing VTT file: %s", workID, vtt)
-                vttFile = open('%s/%s' %(subDir, vtt), 'w')
-                vttFile.write("WEBVTT")
-                # The counter represents how many files of FPS we have -- range is COUNTER*FPS --> (COUNTER+1)* fps
-                # FPS references the frames per second so if we put (1/60), that means a frame EVERY MINUTE
-                # Therefore, we need to invest the FPS
-                # Use %02d to PAD the numbers 
-                
-                baseURL = "https://dnt4vq51jg2tj.cloudfront.net" # There needs to be a better way then the full URL
-                for i in range(0,counter):
-                    startSecond = i * (1/fps)
-                    endSecond = (i + 1) * (1/fps)
-                    startSpan = '%02d:%02d:%02d.000' % ( startSecond / 3600, startSecond / 60 % 60, startSecond % 60) 
-                    endSpan =  '%02d:%02d:%02d.000' % ( endSecond / 3600, endSecond / 60 % 60, endSecond % 60)
-                    
-                    
-                    thumbSpan =  '%s/%s/%s/%s_thumbnail_%d.jpg' % (baseURL, fileName, newDir, fileName,i + 1)
-                    
-                    vttFile.write("\n\n%s --> %s\n%s" % (startSpan, endSpan, thumbSpan))
-                
-                vttFile.close()
-                logging.debug("[%s] Wrote VTT file: %s", workID, vtt)
-                
-                index = str(math.trunc(counter * thumbnailTime))
-                logging.debug("[%s] Key frame identified in index: %s", workID, index)
-                
-                updateExpression = 'set thumbnail = :t, storyboard = :s'
-                thumbnail = '/%s/%s_thumbnail_%s.jpg' % (newDir, fileName,index)
-                
-                # THERE MUST BE A DYNAMIC WAY TO DO THIS BUT I DONT KNOW YET
-                storyboard = '/%s/%s' %(newDir, vtt)
-                
-                '''expressionValues = {
-                    ':t' : STORYBOARD[index]['src'],
-                    ':s' : STORYBOARD
-                }'''
-                
-                expressionValues = {
-                    ':t' : thumbnail,
-                    ':s' : storyboard,
-                }
-                
-                logging.debug("[%s] Update thumbnail value", workID)
-                response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
-
-                OUTPUT = {
-                    'tool' : output,
-                    'dbPrimaryKey' : dbPrimaryKey,
-                    'assetClass' : INPUT['assetClass'], 
-                    'asset' : asset,
-                }
-                
-                swf.respond_activity_task_completed(
-                    taskToken = taskToken,
-                    result = json.dumps(OUTPUT)
-                )
-            # We should catch other errors here
-            except subprocess.CalledProcessError as err:
-                
-                result = { 
-                    'reason' : 'THB-0002_Error in video thumbnail creation',
-                    'detail' : str(err)
-                }
-                
-                logging.error("%s", result)
-                
-                swf.respond_activity_task_failed(
-                    taskToken=taskToken,
-                    reason=json.dumps(result['reason']),
-                    details=json.dumps(result['detail'])
-                )
-                    
-            logging.info("[%s] %s Complete", workID, taskName)
+        updateExpression = 'set thumbnail = :t, storyboard = :s, renditions = :r'
+        thumbnail = '/%s/%s_thumbnail_%s.jpg' % (newDir, fileName,index)
+        
+        # THERE MUST BE A DYNAMIC WAY TO DO THIS BUT I DONT KNOW YET
+        storyboard = '/%s/%s' %(newDir, vtt)
+        
+        '''expressionValues = {
+            ':t' : STORYBOARD[index]['src'],
+            ':s' : STORYBOARD
+        }'''
+        
+        expressionValues = {
+            ':t' : thumbnail,
+            ':s' : storyboard,
+            ':r' : RENDITIONMAP,
+        }
+        
+        logging.debug("[%s] Update thumbnail value", workID)
+        response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
+
+        OUTPUT = {
+            'tool' : output,
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        
+        return OUTPUT
+
+    # We should catch other errors here
+    except subprocess.CalledProcessError as err:
+        
+        result = { 
+            'reason' : 'THB-0002_Error in video thumbnail creation',
+            'detail' : str(err)
+        }
+        
+        raise activityWorker.TaskFailure(result)
+
+def buildThumbnailCommands(asset, outpath, fps, scale, thumbnailMode):
+
+    # Parameters are
+    # -y for
+    # -i for Input
+    # -vf, fps=1,scale= for the video filter stating we want to take every one second
+    FULL = [['ffmpeg'
+        ,'-y'
+        ,'-i', asset
+        ,'-vf', 'fps=%s,scale=%s' %(fps, scale)
+        ,'-loglevel', 'fatal'
+        ,outpath
+    ]]
+
+    # full decodes every frame of the video, which costs as much CPU as a transcode
+    if thumbnailMode == 'full':
+        return FULL
+
+    duration = ffmpegHelper.probeDuration(asset)
+    if not duration:
+        logging.warning("No duration found for %s, using full decode for thumbnails", asset)
+        return FULL
+
+    # keyframe only decodes the keyframes (-skip_frame nokey) and the fps filter repeats the latest one to fill the interval
+    # The timeline is split into THUMBNAIL_PROCESSES ranges. Each ffmpeg seeks to the start of its range on the input side
+    # (-ss before -i jumps straight to the keyframe) and numbers its files from the first frame of its range.
+    # Every range decodes KEYFRAME_MARGIN seconds past its end so that most GOPs reach into the next range,
+    # -frames:v keeps it from writing into the next range. A GOP longer than the margin (screen recordings, some cameras)
+    # still ends a range early, fillThumbnailGaps fills those numbers afterwards.
+    interval = 1.0 / fps
+    frames = int(math.ceil(duration * fps))
+    perProcess = int(math.ceil(float(frames) / THUMBNAIL_PROCESSES))
+
+    cmds = []
+    for first in range(0, frames, perProcess):
+        count = min(perProcess, frames - first)
+        cmds.append(['ffmpeg'
+            ,'-y'
+            ,'-skip_frame', 'nokey'
+            ,'-noaccurate_seek'
+            ,'-ss', '%.3f' % (first * interval)
+            ,'-t', '%.3f' % (count * interval + KEYFRAME_MARGIN)
+            ,'-i', asset
+            ,'-vf', 'fps=%s,scale=%s' %(fps, scale)
+            ,'-frames:v', str(count)
+            ,'-start_number', str(first + 1)
+            ,'-loglevel', 'fatal'
+            ,outpath
+        ])
+
+    return cmds
+
+def reportStep(heartbeat, step):
+
+    # Heartbeat between the steps that run no ffmpeg. Tasks built outside of a worker have no heartbeat
+    if heartbeat is not None:
+        heartbeat({'step' : step})
+
+def extractKeyFrame(asset, outpath, seconds, heartbeat=None):
+
+    # A single frame at the full size of the video. -ss before -i seeks to the keyframe before it and decodes up to it
+    cmd = ['ffmpeg'
+        ,'-y'
+        ,'-ss', '%.3f' % (seconds)
+        ,'-i', asset
+        ,'-frames:v', '1'
+        ,'-q:v', '2'
+        ,'-loglevel', 'fatal'
+        ,outpath
+    ]
+
+    logging.debug("Execute key frame extraction: %s", cmd)
+    return ffmpegHelper.runParallel([cmd], 1, heartbeat)
+
+def fillThumbnailGaps(subDir, fileName):
+
+    # The image2 reader of buildSpriteSheets stops at the first missing number and every VTT cue is one number,
+    # so the sequence must be complete. A missing number gets the thumbnail before it, the frame the fps filter would have
+    # repeated had the keyframe after it been decoded. Numbers missing at the start get the first thumbnail
+    NUMBERS = []
+    prefix = '%s_thumbnail_' % (fileName)
+    for thumb in os.listdir(subDir):
+        if thumb.startswith(prefix) and thumb.endswith('.jpg') and thumb[len(prefix):-4].isdigit():
+            NUMBERS.append(int(thumb[len(prefix):-4]))
+    if not NUMBERS:
+        return 0
+
+    PRESENT = set(NUMBERS)
+    source = min(NUMBERS)
+    filled = 0
+    for number in range(1, max(NUMBERS) + 1):
+        if number in PRESENT:
+            source = number
+            continue
+        shutil.copyfile('%s/%s%d.jpg' % (subDir, prefix, source), '%s/%s%d.jpg' % (subDir, prefix, number))
+        filled = filled + 1
+
+    if filled:
+        logging.info("Filled %d thumbnails missing between keyframes of %s", filled, fileName)
+    return filled
+
+def buildSpriteSheets(subDir, fileName, heartbeat=None):
+
+    # The tile filter fills a sheet with SPRITE_COLUMNS x SPRITE_ROWS input frames and emits it
+    # The last sheet is emitted partly filled when the input runs out
+    cmd = ['ffmpeg'
+        ,'-y'
+        ,'-start_number', '1'
+        ,'-i', '%s/%s_thumbnail_%%d.jpg' % (subDir, fileName)
+        ,'-vf', 'tile=%dx%d' % (SPRITE_COLUMNS, SPRITE_ROWS)
+        ,'-start_number', '1'
+        ,'-loglevel', 'fatal'
+        ,'%s/%s_storyboard_%%d.jpg' % (subDir, fileName)
+    ]
+
+    logging.debug("Execute sprite sheet creation: %s", cmd)
+    return ffmpegHelper.runParallel([cmd], 1, heartbeat)
 
 if __name__ == '__main__':
     
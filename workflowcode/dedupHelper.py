@@ -0,0 +1,107 @@
+""" Duplicate check of an asset against the Assets table before any processing
+
+registerAsset only found a duplicate when its conditional put_item failed, after exiftool or MediaInfo had run.
+For re-uploads of deleted assets the thumbnails and the transcode were then created all over again.
+
+The checksum is computed by the extract activities while the prober reads the asset (see metadataHelper.processFile), so the
+file comes over the network once, and looked up with a single GetItem before the asset is registered:
+    Live asset -- the workflow fails straight away with REG-0001, before any thumbnail or transcode
+    Deleted asset -- the derivatives that are still in S3 under the same folder are reused, the activities that create them are skipped
+    Unknown -- the workflow runs as usual
+The GetItem is strongly consistent and never cached: deleteFiles may run in another process or on another host, and a stale
+"live" answer would fail the re-upload of a deleted asset with a false REG-0001.
+
+Functions:
+    checkDuplicate -- fails the task for a live duplicate, returns the derivatives to reuse for a deleted one
+    lookup -- the live / deleted state of a checksum, or None if the asset was never registered
+    findDerivatives -- the derivatives of a deleted asset that can be reused
+
+"""
+
+from boto3.dynamodb.types import TypeDeserializer
+
+import logging
+
+import activityWorker
+import s3Helper
+
+TABLENAME = 'Assets'
+
+# Database attributes that point to a derivative in S3, relative to the asset's folder
+# renditions is a map of such paths (see thumbnailHelper.renditionOutputs), it is reused when all of them are still there
+DERIVATIVES = ['PDL', 'PDL_Opus', 'HLS', 'thumbnail', 'storyboard', 'waveform', 'renditions']
+
+
+def checkDuplicate(checksum, fileName, workID):
+
+    # Raises TaskFailure (REG-0001) if the asset is registered and live
+    # Returns the derivatives that can be reused ({} for a new asset), for the 'reuse' of the activity output
+    RECORD = lookup(checksum)
+    if RECORD is None:
+        return {}
+
+    if RECORD.get('File_Location') != 'delete':
+        result = {
+            'reason' : 'REG-0001_Duplicate file entry: The file with ID %s already exists' %(checksum),
+            'detail' : 'Asset is registered with location: %s' % (RECORD.get('File_Location'))
+        }
+        raise activityWorker.TaskFailure(result)
+
+    # Re-upload of a deleted asset. Anything that is still in S3 does not need to be created again
+    REUSE = findDerivatives(RECORD, fileName)
+    logging.info("[%s] Re-upload of deleted asset %s, reusing: %s", workID, checksum, REUSE)
+
+    return REUSE
+
+
+def lookup(checksum):
+
+    # Returns None for a new asset, otherwise the record with File_Location, Filename and the derivative attributes
+    client = activityWorker.getClient('dynamodb')
+    response = client.get_item(
+        TableName=TABLENAME,
+        Key={'Checksum' : {'S' : checksum}},
+        ProjectionExpression='Checksum, File_Location, Filename, %s' % (', '.join(DERIVATIVES)),
+        ConsistentRead=True
+    )
+
+    if 'Item' not in response:
+        return None
+
+    deserializer = TypeDeserializer()
+    RECORD = {}
+    for (name, value) in response['Item'].items():
+        RECORD[name] = deserializer.deserialize(value)
+
+    return RECORD
+
+
+def findDerivatives(RECORD, fileName):
+
+    # deleteFiles removes the whole folder from the CDN and near_line, so most deleted assets have nothing left
+    # Derivatives live under the folder of the original upload, so they are only reused when the new upload has the same name
+    if RECORD.get('Filename') != fileName:
+        return {}
+
+    KEYS = set([obj['Key'] for obj in s3Helper.listObjects(fileName + '/')])
+
+    REUSE = {}
+    for name in DERIVATIVES:
+        PATHS = derivativePaths(RECORD.get(name))
+        if PATHS and all(['%s%s' % (fileName, path) in KEYS for path in PATHS]):
+            REUSE[name] = RECORD[name]
+
+    return REUSE
+
+
+def derivativePaths(value):
+
+    # The S3 paths of a derivative attribute: a path, or a (nested) map of paths
+    if isinstance(value, dict):
+        PATHS = []
+        for item in value.values():
+            PATHS.extend(derivativePaths(item))
+        return PATHS
+    if value:
+        return [value]
+    return []
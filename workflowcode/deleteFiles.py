@@ -5,9 +5,6 @@ author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
-import botocore
 import sys
 import os
 import string
@@ -21,91 +18,82 @@ sys.path.insert(0, '/Assets/sharedLibraries')
 import parseHelper
 import databaseHelper
 
-def main(args):
+import activityWorker
+import s3Helper
+
+DOMAIN = 'ITD'
+TASKNAME = 'deleteFiles'
 
-    DOMAIN = 'ITD'
-    VERSION = '1'
+# S3 deletes are network bound
+POLLERS = 1
+WORKERS = 4
 
-    taskName = os.path.basename(__file__)[:-3]
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
-    logging.debug("Creating SWF boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    swf = boto3.client('swf', config=botoConfig)
-    logging.debug("Created SWF boto client: %s", swf)
 
-    BUCKETNAME = "schulerfiles"
+    worker = createWorker()
+    worker.run()
 
-    while True:
 
-        task = swf.poll_for_activity_task(
-            domain=DOMAIN,
-            taskList={'name': taskName},
-            identity='%s-01' %(taskName)
-        )
+def createWorker(client=None):
 
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
-        
-        # Run the operation
-        else:
-            taskToken = task['taskToken']
-            workID = task['workflowExecution']['workflowId']
-            logging.info("[%s] New request for %s", workID, taskName)
-
-            INPUT = json.loads(task['input'])
-            
-            source = INPUT['locationSource']
-            destination = INPUT['locationDestination']
-            dbPrimaryKey = INPUT['dbPrimaryKey']
-            fileKey = INPUT['fileKey'] + '/'
-            
-            # 
-            if source in ['CDN', 'near_line']:
-                
-                BUCKETNAME = "schulerfiles"
-
-                logging.debug("[%s] Creating S3 bucket boto client", workID)
-                s3 = boto3.resource('s3')
-                bucket = s3.Bucket(BUCKETNAME)
-                logging.debug("[%s] Created S3 bucket boto client", workID)
-                
-                for obj in bucket.objects.filter(Prefix=fileKey):
-                    logging.debug("[%s] Deleting object: %s", workID, obj.key)
-                    s3.Object(bucket.name, obj.key).delete()
-            
-            else: #Glacier
-                continue # Add logic for glacier once supported
-            
-            AUDIT = {}
-            AUDIT['User'] = 'System'
-            AUDIT['Timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000",time.gmtime())
-            AUDIT['Action'] = 'Asset removed from %s' % (source)
-            AUDIT['Notes'] = workID
-            
-            # Add the Audit Dictionary to a list so that we can append it
-            aLIST = []
-            aLIST.append(AUDIT)
+    return activityWorker.ActivityWorker(TASKNAME, processTask, domain=DOMAIN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
     
-            updateExpression = 'set File_Location = :d, Audit = list_append(Audit, :a)'
-            
-            expressionValues = {
-                ':d' : destination,
-                ':a' : aLIST
-            }
-            # Call the update function
-            logging.debug("[%s] Updating the asset location and history: %s", workID, destination)
-            response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)       
-            OUTPUT = {
-                    'result' : 'success',
+    source = INPUT['locationSource']
+    destination = INPUT['locationDestination']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+    fileKey = INPUT['fileKey'] + '/'
+    
+    # 
+    if source in ['CDN', 'near_line']:
+        
+        DELETED = s3Helper.deletePrefix(fileKey, workID)
+
+        # Keep the location as it is if anything is left behind, so the delete can be re-run
+        if DELETED['errors']:
+            result = {
+                'reason' : 'DEL-0001_Error deleting files from %s' % (source),
+                'detail' : json.dumps({
+                    'deleted' : DELETED['deleted'],
+                    'errors' : s3Helper.summarizeFailures(DELETED['errors']),
+                })
             }
+            raise activityWorker.TaskFailure(result)
+    
+    else: #Glacier
+        return None # Add logic for glacier once supported
+    
+    AUDIT = {}
+    AUDIT['User'] = 'System'
+    AUDIT['Timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000",time.gmtime())
+    AUDIT['Action'] = 'Asset removed from %s' % (source)
+    AUDIT['Notes'] = workID
+    
+    # Add the Audit Dictionary to a list so that we can append it
+    aLIST = []
+    aLIST.append(AUDIT)
 
-            swf.respond_activity_task_completed(
-                taskToken = taskToken,
-                result = json.dumps(OUTPUT)
-            )
-                    
-            logging.info("[%s] %s Complete", workID, taskName)
+    updateExpression = 'set File_Location = :d, Audit = list_append(Audit, :a)'
+    
+    expressionValues = {
+        ':d' : destination,
+        ':a' : aLIST
+    }
+    # Call the update function
+    logging.debug("[%s] Updating the asset location and history: %s", workID, destination)
+    response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)       
+    OUTPUT = {
+            'result' : 'success',
+            'deleted' : DELETED['deleted'],
+    }
+
+    return OUTPUT
 
 if __name__ == '__main__':
     
@@ -0,0 +1,311 @@
+""" Shared helpers for the activities that run ffmpeg
+
+Functions:
+    probeDuration -- length of a media file in seconds, using ffprobe
+    probeDimensions -- displayed width and height of the first video stream (or image), using ffprobe
+    hasAudio -- whether a media file has an audio stream, using ffprobe
+    probeKeyframes -- the times of the keyframes of the first video stream around some target times, using ffprobe
+    runParallel -- runs several ffmpeg commands side by side with a cap on the number of processes, reports their progress
+                   and kills them when they stop making progress
+    throughput -- the time based throughput of a job, for the activity outputs
+
+"""
+
+import os
+import subprocess
+import tempfile
+import time
+import simplejson as json
+
+import logging
+
+# Seconds between progress reports of runParallel
+PROGRESS_INTERVAL = 5
+
+# Seconds without progress after which runParallel kills the ffmpeg processes. The heartbeat timeout of the task
+# (HeartbeatSeconds in IPD.json) has long fired by then and the task is running again on another host
+STALL_TIMEOUT = 300
+
+# Seconds of packets probeKeyframes reads before and after each target time. Longer than the GOP of any usual source
+KEYFRAME_WINDOW = 10
+
+
+class ProgressStalled(subprocess.CalledProcessError):
+
+    # A command that stopped making progress and was killed. A CalledProcessError, so the activities fail the task as they do for ffmpeg errors
+    def __init__(self, cmd, seconds):
+        subprocess.CalledProcessError.__init__(self, -9, cmd)
+        self.seconds = seconds
+
+    def __str__(self):
+        return "Command '%s' made no progress for %d seconds and was killed" % (self.cmd, self.seconds)
+
+
+def probeDuration(asset):
+
+    # Returns None when the container does not report a duration (e.g. some live captures)
+    cmd = ['ffprobe'
+        ,'-v', 'error'
+        ,'-show_entries', 'format=duration'
+        ,'-of', 'default=noprint_wrappers=1:nokey=1'
+        ,asset
+    ]
+
+    output = subprocess.check_output(cmd)
+    try:
+        return float(output.strip())
+    except ValueError:
+        return None
+
+
+def probeDimensions(asset):
+
+    # The size after the rotation of the stream, as ffmpeg's filters see it: ffmpeg turns the frames upright before filtering,
+    # so a phone clip coded 1920x1080 with a rotation of 90 degrees is 1080x1920. The rotation is the rotate tag
+    # (older muxers) or the display matrix side data (newer ones)
+    cmd = ['ffprobe'
+        ,'-v', 'error'
+        ,'-select_streams', 'v:0'
+        ,'-show_entries', 'stream=width,height:stream_tags=rotate:stream_side_data=rotation'
+        ,'-of', 'json'
+        ,asset
+    ]
+
+    STREAM = json.loads(subprocess.check_output(cmd))['streams'][0]
+    width, height = int(STREAM['width']), int(STREAM['height'])
+
+    ROTATIONS = [STREAM.get('tags', {}).get('rotate')] + [SIDEDATA.get('rotation') for SIDEDATA in STREAM.get('side_data_list', [])]
+    for rotation in ROTATIONS:
+        try:
+            if int(round(float(rotation))) % 180 == 90:
+                return height, width
+        except (TypeError, ValueError):
+            pass
+
+    return width, height
+
+
+def hasAudio(asset):
+
+    cmd = ['ffprobe'
+        ,'-v', 'error'
+        ,'-select_streams', 'a'
+        ,'-show_entries', 'stream=index'
+        ,'-of', 'csv=p=0'
+        ,asset
+    ]
+
+    output = subprocess.check_output(cmd)
+    return output.strip() != ''
+
+
+def probeKeyframes(asset, TARGETS, window=KEYFRAME_WINDOW, heartbeat=None):
+
+    # Returns the keyframe times in seconds from the start of the file (the times -ss takes) within window seconds of
+    # every target time. Nothing is decoded, and only the packets of those windows are demuxed (-read_intervals), not
+    # the whole file: one ffprobe per target, with heartbeat(DETAILS) called before each of them
+    cmd = ['ffprobe'
+        ,'-v', 'error'
+        ,'-show_entries', 'format=start_time'
+        ,'-of', 'default=noprint_wrappers=1:nokey=1'
+        ,asset
+    ]
+    try:
+        startTime = float(subprocess.check_output(cmd).strip())
+    except ValueError:
+        startTime = 0.0
+
+    KEYFRAMES = set()
+    for (i, target) in enumerate(TARGETS):
+        if heartbeat is not None:
+            heartbeat({'keyframes' : '%d/%d' % (i, len(TARGETS))})
+
+        # The intervals are in the timestamps of the file, which start at startTime
+        start = max(0.0, target - window) + startTime
+        cmd = ['ffprobe'
+            ,'-v', 'error'
+            ,'-select_streams', 'v:0'
+            ,'-read_intervals', '%.6f%%+%.6f' % (start, 2 * window)
+            ,'-show_entries', 'packet=pts_time,flags'
+            ,'-of', 'csv=p=0'
+            ,asset
+        ]
+
+        for line in subprocess.check_output(cmd).splitlines():
+            FIELDS = line.strip().split(',')
+            if len(FIELDS) < 2 or 'K' not in FIELDS[1]:
+                continue
+            try:
+                KEYFRAMES.add(float(FIELDS[0]) - startTime)
+            except ValueError:
+                # N/A for packets without a timestamp
+                pass
+
+    return sorted(KEYFRAMES)
+
+
+def runParallel(cmds, processes, progress=None, duration=None, stallTimeout=STALL_TIMEOUT):
+
+    # Start up to "processes" commands at a time and wait for all of them
+    # If a command fails, nothing new is started, the running ones are allowed to finish and CalledProcessError is raised
+    # Returns the combined stdout of the commands, like check_output would for a single one
+    #
+    # Every ffmpeg writes its -progress report to a file of its own. With progress, progress(REPORT) is called
+    # whenever the work has moved on, at most every PROGRESS_INTERVAL seconds. duration (the seconds of media the commands
+    # cover together) turns the reports into a percentage. An ffmpeg that hangs stops the reports, so the heartbeat
+    # timeout of the task catches it on the service side
+    #
+    # When the work has not moved on for stallTimeout seconds, every running command is killed and ProgressStalled is raised
+    # The commands are also killed when anything else interrupts the wait, e.g. progress raising activityWorker.TaskTimedOut
+    pending = list(cmds)
+    running = []
+    OUTPUTS = []
+    PROGRESSFILES = []
+    failure = None
+    completed = 0
+    lastReport = time.time()
+    lastPosition = None
+    lastMove = time.time()
+    # Only ffmpeg reports its progress, other commands can't be watched
+    watched = len([cmd for cmd in cmds if cmd[0] != 'ffmpeg']) == 0
+
+    try:
+        while pending or running:
+            while pending and len(running) < processes and failure is None:
+                cmd = pending.pop(0)
+                if cmd[0] == 'ffmpeg':
+                    (fd, progressFile) = tempfile.mkstemp(suffix='.progress')
+                    os.close(fd)
+                    PROGRESSFILES.append(progressFile)
+                    cmd = cmd[:1] + ['-progress', progressFile, '-nostats'] + cmd[1:]
+                logging.debug("Starting: %s", cmd)
+                # stdout goes to a file so that a chatty command can't block on a full pipe
+                OUTPUTS.append(tempfile.TemporaryFile())
+                running.append((cmd, subprocess.Popen(cmd, stdout=OUTPUTS[-1])))
+
+            if failure is not None:
+                pending = []
+
+            time.sleep(0.1)
+            for (cmd, process) in list(running):
+                returncode = process.poll()
+                if returncode is None:
+                    continue
+                running.remove((cmd, process))
+                completed = completed + 1
+                if returncode != 0 and failure is None:
+                    failure = subprocess.CalledProcessError(returncode, cmd)
+
+            if running and time.time() - lastReport >= PROGRESS_INTERVAL:
+                REPORT = combineProgress([readProgress(f) for f in PROGRESSFILES], duration)
+                REPORT['processes'] = '%d/%d' % (completed, len(cmds))
+                position = (REPORT['seconds'], REPORT['frames'], completed)
+                if position != lastPosition:
+                    if progress is not None:
+                        progress(REPORT)
+                    lastPosition = position
+                    lastMove = time.time()
+                elif watched and time.time() - lastMove >= stallTimeout:
+                    logging.error("No progress for %d seconds, killing: %s", stallTimeout, [cmd for (cmd, process) in running])
+                    raise ProgressStalled(running[0][0], stallTimeout)
+                lastReport = time.time()
+
+        output = ''
+        for f in OUTPUTS:
+            f.seek(0)
+            output = output + f.read()
+    finally:
+        # Nothing is left running when the wait is interrupted, a stray ffmpeg would hold the cores of the next task
+        for (cmd, process) in running:
+            try:
+                process.kill()
+                process.wait()
+            except OSError:
+                pass
+        for f in OUTPUTS:
+            f.close()
+        for f in PROGRESSFILES:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+    if failure is not None:
+        raise failure
+
+    return output
+
+
+def readProgress(path):
+
+    # ffmpeg appends a block of key=value lines to the -progress file about twice a second, each block ends with progress=continue/end
+    # Returns the last complete block
+    LATEST = {}
+    BLOCK = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                if '=' not in line:
+                    continue
+                (key, value) = line.strip().split('=', 1)
+                BLOCK[key] = value
+                if key == 'progress':
+                    LATEST = BLOCK
+                    BLOCK = {}
+    except IOError:
+        pass
+
+    return LATEST
+
+
+def combineProgress(BLOCKS, duration):
+
+    # Seconds of media and frames written, frames per second and speed (x realtime) summed over the ffmpeg processes
+    seconds = 0.0
+    frames = 0
+    fps = 0.0
+    speed = 0.0
+    for BLOCK in BLOCKS:
+        # out_time_ms is in microseconds as well, older builds only write that one
+        outTime = BLOCK.get('out_time_us', BLOCK.get('out_time_ms'))
+        try:
+            seconds = seconds + max(0, int(outTime)) / 1000000.0
+        except (TypeError, ValueError):
+            pass
+        try:
+            frames = frames + int(BLOCK.get('frame'))
+        except (TypeError, ValueError):
+            pass
+        if BLOCK.get('progress') == 'continue':
+            try:
+                fps = fps + float(BLOCK.get('fps'))
+            except (TypeError, ValueError):
+                pass
+            try:
+                speed = speed + float(BLOCK.get('speed', '').rstrip('x'))
+            except ValueError:
+                pass
+
+    REPORT = {
+        'seconds' : round(seconds, 1),
+        'frames' : frames,
+        'fps' : round(fps, 1),
+        'speed' : round(speed, 2),
+    }
+    if duration:
+        REPORT['percent'] = round(min(100.0, 100.0 * seconds / duration), 1)
+
+    return REPORT
+
+
+def throughput(duration, seconds):
+
+    # Time based throughput of a job: the seconds of media it covered, how long it took and the speed in x realtime
+    STATS = {
+        'seconds' : round(seconds, 2),
+        'mediaSeconds' : duration,
+    }
+    if duration and seconds > 0:
+        STATS['speed'] = round(duration / seconds, 2)
+
+    return STATS
@@ -0,0 +1,192 @@
+""" Reverse geocoding cache for GPS tagged assets
+
+Every asset with a GPS position used to call parseHelper.reverseLookup while its metadata was extracted, a remote call on the
+ingest path for each file, and most uploads come from the same few sites. Addresses are now looked up in two tiers:
+    Memory -- an LRU of the most recent locations, shared by every activity in the process
+    Disk -- a sqlite file on the host, kept across restarts and filled in bulk with preload
+Positions are keyed by their coordinates rounded to KEY_PRECISION decimal places (about 100 m), so photos taken around
+the same site share an entry.
+
+A position that is not cached is never looked up on the caller's thread. It is queued for a background thread, lookup
+returns None, and the callback (if any) is called with the address once it is known. registerAsset uses the callback to
+add the Address to the database entry after the fact.
+
+Functions:
+    lookup -- the cached address of a position, or None while it is fetched in the background
+    preload -- loads known addresses from a JSON file into the cache
+    cacheKey -- the cache key of a position
+
+"""
+
+import sys
+import os
+import sqlite3
+import threading
+import collections
+import Queue
+import simplejson as json
+
+import logging
+
+sys.path.insert(0, '/Assets/sharedLibraries/')
+import parseHelper
+
+# Decimal places of the coordinates in the cache key. 3 places are about 110 m of latitude
+KEY_PRECISION = 3
+
+# Addresses kept in memory
+CACHE_SIZE = 5000
+
+# Persistent cache on the local disk of the host (not the shared /Assets volume, sqlite locking is not safe over NFS)
+GEOCODE_DB = '/var/tmp/sdms/geocode.db'
+
+ADDRESSES = collections.OrderedDict()
+CACHE_LOCK = threading.Lock()
+
+DB = {}
+DB_LOCK = threading.Lock()
+
+# Cache key -> callbacks waiting for the address. A position is only queued once, however many assets are waiting for it
+PENDING = {}
+PENDING_LOCK = threading.Lock()
+FILLS = Queue.Queue()
+FILLER = {}
+
+
+def cacheKey(latitude, longitude):
+
+    # Latitude and Longitude come from exiftool / MediaInfo as decimal strings ("+40.12345678")
+    try:
+        return '%.*f,%.*f' % (KEY_PRECISION, float(latitude), KEY_PRECISION, float(longitude))
+    except (TypeError, ValueError):
+        return None
+
+
+def lookup(latitude, longitude, callback=None):
+
+    # Returns the address if it is cached. Otherwise the position is queued and callback(address) is called when it has been fetched
+    key = cacheKey(latitude, longitude)
+    if key is None:
+        logging.warning("Cannot geocode position: %s, %s", latitude, longitude)
+        return None
+
+    address = _cached(key)
+    if address is not None:
+        return address
+
+    with PENDING_LOCK:
+        if key in PENDING:
+            if callback is not None:
+                PENDING[key].append(callback)
+            return None
+        PENDING[key] = [callback] if callback is not None else []
+
+    _startFiller()
+    FILLS.put((key, latitude, longitude))
+    logging.debug("Queued reverse lookup of %s", key)
+
+    return None
+
+
+def preload(path):
+
+    # path is a JSON list of [latitude, longitude, address], e.g. the sites most uploads come from
+    with open(path) as f:
+        ENTRIES = json.load(f)
+
+    count = 0
+    for (latitude, longitude, address) in ENTRIES:
+        key = cacheKey(latitude, longitude)
+        if key is not None:
+            _store(key, address)
+            count = count + 1
+
+    logging.info("Preloaded %d addresses from %s", count, path)
+    return count
+
+
+def _cached(key):
+
+    with CACHE_LOCK:
+        address = ADDRESSES.pop(key, None)
+        if address is not None:
+            ADDRESSES[key] = address
+            return address
+
+    with DB_LOCK:
+        row = _db().execute('SELECT address FROM addresses WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+
+    _remember(key, row[0])
+    return row[0]
+
+
+def _store(key, address):
+
+    with DB_LOCK:
+        db = _db()
+        db.execute('INSERT OR REPLACE INTO addresses (key, address) VALUES (?, ?)', (key, address))
+        db.commit()
+    _remember(key, address)
+
+
+def _remember(key, address):
+
+    with CACHE_LOCK:
+        ADDRESSES.pop(key, None)
+        ADDRESSES[key] = address
+        while len(ADDRESSES) > CACHE_SIZE:
+            ADDRESSES.popitem(last=False)
+
+
+def _db():
+
+    # Called with DB_LOCK held. One connection per process, shared by the callers and the filler thread
+    if 'connection' not in DB:
+        directory = os.path.dirname(GEOCODE_DB)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process created it first
+                pass
+        connection = sqlite3.connect(GEOCODE_DB, timeout=30, check_same_thread=False)
+        connection.execute('CREATE TABLE IF NOT EXISTS addresses (key TEXT PRIMARY KEY, address TEXT)')
+        connection.commit()
+        DB['connection'] = connection
+    return DB['connection']
+
+
+def _startFiller():
+
+    with PENDING_LOCK:
+        if 'thread' not in FILLER:
+            thread = threading.Thread(target=_fill, name='geocodeFiller')
+            thread.daemon = True
+            thread.start()
+            FILLER['thread'] = thread
+
+
+def _fill():
+
+    while True:
+        (key, latitude, longitude) = FILLS.get()
+
+        address = None
+        try:
+            address = parseHelper.reverseLookup(latitude, longitude)[0]['formatted_address']
+            _store(key, address)
+        except Exception as err:
+            logging.warning("Reverse lookup of %s failed: %s", key, str(err))
+
+        with PENDING_LOCK:
+            CALLBACKS = PENDING.pop(key, [])
+
+        if address is None:
+            continue
+        for callback in CALLBACKS:
+            try:
+                callback(address)
+            except Exception as err:
+                logging.warning("Geocode callback for %s failed: %s", key, str(err))
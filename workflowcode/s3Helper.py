@@ -0,0 +1,352 @@
+""" Shared S3 operations for the distribution and file management activities
+
+All of the operations run over the single pooled S3 client of the process (see activityWorker.getClient)
+
+Functions:
+    uploadDirectory -- uploads an asset directory, many files in parallel, with multipart for the large files
+    listObjects -- every object under a prefix, from a single paginated listing
+    deletePrefix -- deletes every object under a prefix with batched DeleteObjects requests
+    transitionPrefix -- moves every object under a prefix to another storage class with server side copies
+    summarizeFailures -- the count and the first few of the failed keys, for the failure of a task
+
+"""
+
+import os
+import time
+import threading
+import Queue
+from boto3.s3.transfer import TransferConfig
+
+import logging
+
+import activityWorker
+
+BUCKETNAME = "schulerfiles"
+
+# Number of files uploaded at the same time
+UPLOAD_CONCURRENCY = 16
+# Attempts per file before the upload is reported as failed
+UPLOAD_ATTEMPTS = 3
+# Seconds between progress messages
+PROGRESS_INTERVAL = 10
+# Content types the players check for. Everything else is stored with the S3 default
+CONTENT_TYPES = {
+    '.m3u8' : 'application/vnd.apple.mpegurl',
+    '.m4s' : 'video/iso.segment',
+}
+
+# Files above the threshold are sent as multipart uploads, max_concurrency parts at a time
+# Larger parts mean fewer requests for the multi-GB PDL files
+MB = 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * MB,
+    multipart_chunksize=64 * MB,
+    max_concurrency=10,
+    use_threads=True
+)
+
+# DeleteObjects accepts up to 1,000 keys per request
+DELETE_BATCH = 1000
+# Number of DeleteObjects requests in flight at the same time
+DELETE_CONCURRENCY = 4
+
+# Number of objects copied at the same time when changing the storage class
+TRANSITION_CONCURRENCY = 16
+# copy_object only accepts sources up to 5 GB, anything larger is copied in parts with upload_part_copy
+COPY_LIMIT = 5 * 1024 * MB
+COPY_PART_SIZE = 512 * MB
+# Number of parts of one large object copied at the same time
+COPY_PART_CONCURRENCY = 8
+
+# Enough connections for every file in flight plus the parts of a multipart upload
+MAX_POOL_CONNECTIONS = 100
+
+# Failed keys listed in the failure of a task, the others are only counted (see summarizeFailures)
+FAILURES_REPORTED = 20
+
+
+def getClient():
+
+    return activityWorker.getClient('s3', maxPoolConnections=MAX_POOL_CONNECTIONS)
+
+
+class Progress(object):
+
+    # Callbacks arrive from many transfer threads at once
+    def __init__(self, workID, totalBytes):
+
+        self.workID = workID
+        self.totalBytes = totalBytes
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.lastReport = time.time()
+
+    def __call__(self, bytesTransferred):
+
+        with self.lock:
+            self.bytes = self.bytes + bytesTransferred
+            if time.time() - self.lastReport >= PROGRESS_INTERVAL:
+                self.lastReport = time.time()
+                logging.info("[%s] Uploaded %d of %d bytes (%d%%)", self.workID, self.bytes, self.totalBytes, self.bytes * 100 / max(self.totalBytes, 1))
+
+
+def runConcurrently(ITEMS, function, concurrency):
+
+    # Calls function(item) for every item, on up to "concurrency" threads, and waits for all of them
+    # function is expected to deal with its own errors
+    pending = Queue.Queue()
+    for item in ITEMS:
+        pending.put(item)
+
+    def run():
+        while True:
+            try:
+                item = pending.get_nowait()
+            except Queue.Empty:
+                return
+            function(item)
+
+    threads = []
+    for i in range(min(concurrency, len(ITEMS))):
+        t = threading.Thread(target=run)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+
+def uploadDirectory(filePath, fileName, workID, extraArgs=None, concurrency=UPLOAD_CONCURRENCY):
+
+    # fileName will serve as the FOLDERNAME. Each file is stored under fileName/<directory name>/<file>
+    # Returns the transfer statistics: files, bytes, seconds, bytesPerSecond and the list of files that failed
+    if extraArgs is None:
+        extraArgs = {'ServerSideEncryption' : 'AES256'}
+
+    FILES = []
+    for dirName, dirList, fileList in os.walk(filePath):
+        key = os.path.split(dirName)[1]
+        for f in fileList:
+            upfile = os.path.join(dirName,f)
+            FILES.append((os.path.getsize(upfile), upfile, os.path.join(fileName, key, f)))
+
+    # Start the large files first so that they don't end up running alone at the end
+    FILES.sort(reverse=True)
+    totalBytes = sum([size for (size, upfile, s3key) in FILES])
+    logging.info("[%s] Distributing %d files (%d bytes)", workID, len(FILES), totalBytes)
+
+    client = getClient()
+    progress = Progress(workID, totalBytes)
+
+    FAILED = []
+    failedLock = threading.Lock()
+
+    def upload(item):
+        (size, upfile, s3key) = item
+        ARGS = extraArgs
+        contentType = CONTENT_TYPES.get(os.path.splitext(upfile)[1].lower())
+        if contentType is not None:
+            ARGS = dict(extraArgs, ContentType=contentType)
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            try:
+                logging.debug("[%s] Started uploading %s with key: %s", workID, upfile, s3key)
+                client.upload_file(upfile, BUCKETNAME, s3key, ExtraArgs=ARGS, Callback=progress, Config=TRANSFER_CONFIG)
+                logging.debug("[%s] Completed uploading %s with key: %s", workID, upfile, s3key)
+                return
+            except Exception as err:
+                logging.warning("[%s] Upload attempt %d of %s failed: %s", workID, attempt, upfile, str(err))
+                if attempt < UPLOAD_ATTEMPTS:
+                    time.sleep(2 ** attempt)
+
+        with failedLock:
+            FAILED.append(upfile)
+
+    startTime = time.time()
+    runConcurrently(FILES, upload, concurrency)
+    seconds = time.time() - startTime
+
+    STATS = {
+        'files' : len(FILES),
+        'bytes' : totalBytes,
+        'seconds' : round(seconds, 3),
+        'bytesPerSecond' : int(totalBytes / max(seconds, 0.001)),
+        'failed' : FAILED,
+    }
+    logging.info("[%s] Distribution finished: %s", workID, STATS)
+
+    return STATS
+
+
+def listObjects(prefix):
+
+    # Each entry carries Key, Size and StorageClass
+    client = getClient()
+    OBJECTS = []
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKETNAME, Prefix=prefix):
+        OBJECTS.extend(page.get('Contents', []))
+
+    return OBJECTS
+
+
+def deletePrefix(prefix, workID, concurrency=DELETE_CONCURRENCY):
+
+    # Returns the number of objects deleted and the per key errors as {'Key', 'Code', 'Message'}
+    client = getClient()
+    KEYS = [obj['Key'] for obj in listObjects(prefix)]
+    BATCHES = [KEYS[i:i + DELETE_BATCH] for i in range(0, len(KEYS), DELETE_BATCH)]
+    logging.info("[%s] Deleting %d objects under %s in %d batches", workID, len(KEYS), prefix, len(BATCHES))
+
+    ERRORS = []
+    errorLock = threading.Lock()
+
+    def delete(batch):
+        # Quiet mode only reports the keys that could not be deleted
+        try:
+            response = client.delete_objects(
+                Bucket=BUCKETNAME,
+                Delete={
+                    'Objects' : [{'Key' : key} for key in batch],
+                    'Quiet' : True
+                }
+            )
+            BATCH_ERRORS = response.get('Errors', [])
+        except Exception as err:
+            BATCH_ERRORS = [{'Key' : key, 'Code' : 'RequestFailed', 'Message' : str(err)} for key in batch]
+
+        for error in BATCH_ERRORS:
+            logging.debug("[%s] Could not delete %s: %s", workID, error['Key'], error.get('Message'))
+
+        with errorLock:
+            ERRORS.extend(BATCH_ERRORS)
+
+    runConcurrently(BATCHES, delete, concurrency)
+
+    RESULT = {
+        'deleted' : len(KEYS) - len(ERRORS),
+        'errors' : ERRORS,
+    }
+    logging.info("[%s] Deleted %d objects under %s, %d errors", workID, RESULT['deleted'], prefix, len(ERRORS))
+
+    return RESULT
+
+
+def summarizeFailures(FAILURES):
+
+    # The number of failures and the first FAILURES_REPORTED of them. A prefix can fail on thousands of keys, far more
+    # than fit in the details of a task failure
+    return {
+        'count' : len(FAILURES),
+        'first' : FAILURES[:FAILURES_REPORTED],
+    }
+
+
+def copyLarge(client, key, size, storageClass):
+
+    # A multipart upload does not carry the content type and user metadata over like copy_object does, so they are read first
+    head = client.head_object(Bucket=BUCKETNAME, Key=key)
+    upload = client.create_multipart_upload(
+        Bucket=BUCKETNAME,
+        Key=key,
+        StorageClass=storageClass,
+        ServerSideEncryption='AES256',
+        ContentType=head.get('ContentType', 'binary/octet-stream'),
+        Metadata=head.get('Metadata', {})
+    )
+    uploadId = upload['UploadId']
+
+    RANGES = []
+    for (i, start) in enumerate(range(0, size, COPY_PART_SIZE)):
+        RANGES.append((i + 1, start, min(start + COPY_PART_SIZE, size) - 1))
+
+    PARTS = {}
+    ERRORS = []
+
+    def copyPart(item):
+        (partNumber, first, last) = item
+        try:
+            response = client.upload_part_copy(
+                Bucket=BUCKETNAME,
+                Key=key,
+                UploadId=uploadId,
+                PartNumber=partNumber,
+                CopySource={'Bucket' : BUCKETNAME, 'Key' : key},
+                CopySourceRange='bytes=%d-%d' % (first, last)
+            )
+            PARTS[partNumber] = response['CopyPartResult']['ETag']
+        except Exception as err:
+            ERRORS.append(str(err))
+
+    runConcurrently(RANGES, copyPart, COPY_PART_CONCURRENCY)
+
+    if ERRORS:
+        client.abort_multipart_upload(Bucket=BUCKETNAME, Key=key, UploadId=uploadId)
+        raise Exception(ERRORS[0])
+
+    client.complete_multipart_upload(
+        Bucket=BUCKETNAME,
+        Key=key,
+        UploadId=uploadId,
+        MultipartUpload={'Parts' : [{'PartNumber' : n, 'ETag' : PARTS[n]} for n in sorted(PARTS)]}
+    )
+
+
+def transitionPrefix(prefix, storageClass, workID, skipExisting=False, concurrency=TRANSITION_CONCURRENCY):
+
+    # Copies every object under the prefix onto itself with the new storage class
+    # With skipExisting, objects that are already in storageClass are left alone, so a re-run only copies what is left
+    # Returns the number of objects and bytes moved, the number skipped and the keys that failed
+    client = getClient()
+    OBJECTS = listObjects(prefix)
+
+    PENDING = []
+    skipped = 0
+    for obj in OBJECTS:
+        if skipExisting and obj.get('StorageClass', 'STANDARD') == storageClass:
+            skipped = skipped + 1
+        else:
+            PENDING.append(obj)
+
+    # Start the large objects first so that they don't end up running alone at the end
+    PENDING.sort(key=lambda obj: obj['Size'], reverse=True)
+    logging.info("[%s] Moving %d objects under %s to %s, %d already there", workID, len(PENDING), prefix, storageClass, skipped)
+
+    MOVED = []
+    FAILED = []
+    resultLock = threading.Lock()
+
+    def transition(obj):
+        key = obj['Key']
+        try:
+            logging.debug("[%s] Moving object %s to %s", workID, key, storageClass)
+            if obj['Size'] > COPY_LIMIT:
+                copyLarge(client, key, obj['Size'], storageClass)
+            else:
+                client.copy_object(
+                    CopySource={'Bucket' : BUCKETNAME, 'Key' : key},
+                    Bucket=BUCKETNAME,
+                    Key=key,
+                    StorageClass=storageClass,
+                    ServerSideEncryption='AES256'
+                )
+        except Exception as err:
+            logging.warning("[%s] Could not move %s: %s", workID, key, str(err))
+            with resultLock:
+                FAILED.append(key)
+            return
+
+        with resultLock:
+            MOVED.append(obj['Size'])
+
+    startTime = time.time()
+    runConcurrently(PENDING, transition, concurrency)
+
+    STATS = {
+        'objects' : len(MOVED),
+        'bytes' : sum(MOVED),
+        'skipped' : skipped,
+        'seconds' : round(time.time() - startTime, 3),
+        'failed' : FAILED,
+    }
+    logging.info("[%s] Storage class transition finished: %s", workID, STATS)
+
+    return STATS
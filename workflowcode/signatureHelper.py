@@ -0,0 +1,184 @@
+""" Content sniffing of the assets on the landing pad
+
+identifyAssetClass used to classify an asset by its extension only, so a misnamed file (a PNG saved as .jpg is fine,
+a WAV saved as .mp4 is not) went down the wrong branch of the workflow and only failed in the extractor or the transcode.
+The asset class is now taken from the magic bytes at the start of the file:
+    One read of the first SNIFF_BYTES bytes, whatever the size of the asset
+    The header is matched against a prefix trie compiled once from SIGNATURES, so a match costs the length of
+    the longest signature, not the number of signatures
+    The longest (most specific) match wins, e.g. RIFF....WAVE is audio and RIFF....AVI is video
+
+ISO base media files (MP4, MOV, 3GP, HEIF, AVIF, CR3) all start with an ftyp box, only its major brand tells them apart.
+Each known brand has a signature of its own (see FTYP_BRANDS), an unknown brand matches nothing rather than being taken for video.
+
+Some containers hold audio or video (Ogg, Matroska, ASF, MPEG-4 with a generic brand). For those the extension is the
+tiebreaker between the asset classes of the signature. Files that match no signature (raw H.264 streams, ...) are still
+classified by their extension.
+
+Functions:
+    match -- the container and candidates of the longest signature a header matches
+    sniff -- the candidates of the signature the header of an asset matches, or an empty list
+    classify -- the asset class, MIME type and container of an asset, with the extension as the tiebreaker
+
+"""
+
+import logging
+
+# Every signature below is within the first 189 bytes, one page is read anyway
+SNIFF_BYTES = 4096
+
+# Major brands of the ftyp box at offset 4 -> (container, candidates)
+FTYP_BRANDS = [
+    # HEIF still images and image sequences (HEVC or other codecs), AVIF
+    (['heic', 'heix', 'heim', 'heis'], 'HEIF', [('Image', 'image/heic')]),
+    (['hevc', 'hevx', 'hevm', 'hevs'], 'HEIF', [('Image', 'image/heic-sequence')]),
+    (['mif1'], 'HEIF', [('Image', 'image/heif')]),
+    (['msf1'], 'HEIF', [('Image', 'image/heif-sequence')]),
+    (['avif'], 'AVIF', [('Image', 'image/avif')]),
+    (['avis'], 'AVIF', [('Image', 'image/avif-sequence')]),
+    # Canon raw
+    (['crx '], 'CR3', [('Image', 'image/x-canon-cr3')]),
+    # Audio only MPEG-4 (iTunes audio and audio books)
+    (['M4A ', 'M4B ', 'M4P '], 'MPEG-4', [('Audio', 'audio/mp4')]),
+    # Generic MPEG-4 brands, audio or video
+    (['isom', 'iso2', 'iso4', 'iso5', 'iso6', 'mp41', 'mp42', 'avc1', 'dash', 'mmp4', 'MSNV', 'XAVC', 'f4v '], 'MPEG-4', [('Video', 'video/mp4'), ('Audio', 'audio/mp4')]),
+    (['M4V ', 'M4VH', 'M4VP'], 'MPEG-4', [('Video', 'video/x-m4v')]),
+    (['qt  '], 'QuickTime', [('Video', 'video/quicktime')]),
+    # 3gp4, 3gp5, 3g2a, ... the prefix is enough
+    (['3gp'], '3GPP', [('Video', 'video/3gpp'), ('Audio', 'audio/3gpp')]),
+    (['3g2'], '3GPP2', [('Video', 'video/3gpp2'), ('Audio', 'audio/3gpp2')]),
+]
+
+# (pattern, container, candidates)
+# The pattern is matched from the first byte. Strings must match, an integer skips that many bytes (any value)
+# The candidates are the (asset class, MIME type) the container can be, the first one is used unless the extension says otherwise
+SIGNATURES = [
+    # Image
+    (('\xff\xd8\xff',), 'JPEG', [('Image', 'image/jpeg')]),
+    (('\x89PNG\r\n\x1a\n',), 'PNG', [('Image', 'image/png')]),
+    (('GIF87a',), 'GIF', [('Image', 'image/gif')]),
+    (('GIF89a',), 'GIF', [('Image', 'image/gif')]),
+    (('II*\x00',), 'TIFF', [('Image', 'image/tiff')]),
+    (('MM\x00*',), 'TIFF', [('Image', 'image/tiff')]),
+    (('RIFF', 4, 'WEBP'), 'WebP', [('Image', 'image/webp')]),
+
+    # Audio
+    (('ID3',), 'MPEG Audio', [('Audio', 'audio/mpeg')]),
+    (('\xff\xfb',), 'MPEG Audio', [('Audio', 'audio/mpeg')]),
+    (('\xff\xf3',), 'MPEG Audio', [('Audio', 'audio/mpeg')]),
+    (('\xff\xf2',), 'MPEG Audio', [('Audio', 'audio/mpeg')]),
+    (('\xff\xf1',), 'ADTS', [('Audio', 'audio/aac')]),
+    (('\xff\xf9',), 'ADTS', [('Audio', 'audio/aac')]),
+    (('fLaC',), 'FLAC', [('Audio', 'audio/flac')]),
+    (('RIFF', 4, 'WAVE'), 'Wave', [('Audio', 'audio/wav')]),
+    (('FORM', 4, 'AIFF'), 'AIFF', [('Audio', 'audio/aiff')]),
+    (('FORM', 4, 'AIFC'), 'AIFF', [('Audio', 'audio/aiff')]),
+
+    # Video
+    ((4, 'moov'), 'QuickTime', [('Video', 'video/quicktime')]),
+    ((4, 'mdat'), 'QuickTime', [('Video', 'video/quicktime')]),
+    ((4, 'wide'), 'QuickTime', [('Video', 'video/quicktime')]),
+    (('RIFF', 4, 'AVI '), 'AVI', [('Video', 'video/x-msvideo')]),
+    (('OggS',), 'Ogg', [('Audio', 'audio/ogg'), ('Video', 'video/ogg')]),
+    (('\x1aE\xdf\xa3',), 'Matroska', [('Video', 'video/x-matroska'), ('Audio', 'audio/x-matroska')]),
+    (('0&\xb2u\x8ef\xcf\x11',), 'ASF', [('Video', 'video/x-ms-asf'), ('Audio', 'audio/x-ms-wma')]),
+    (('FLV\x01',), 'Flash Video', [('Video', 'video/x-flv')]),
+    (('FWS',), 'Shockwave Flash', [('Video', 'application/x-shockwave-flash')]),
+    (('CWS',), 'Shockwave Flash', [('Video', 'application/x-shockwave-flash')]),
+    (('\x00\x00\x01\xba',), 'MPEG-PS', [('Video', 'video/mpeg')]),
+    (('\x00\x00\x01\xb3',), 'MPEG Video', [('Video', 'video/mpeg')]),
+    # Transport stream: a sync byte at the start of the first two 188 byte packets
+    (('G', 187, 'G'), 'MPEG-TS', [('Video', 'video/mp2t')]),
+    (('\x06\x0e\x2b\x34\x02\x05\x01\x01\x0d\x01\x02',), 'MXF', [('Video', 'application/mxf')]),
+] + [((4, 'ftyp' + brand), container, candidates) for (BRANDS, container, candidates) in FTYP_BRANDS for brand in BRANDS]
+
+# Key of the signature that ends at a node of the trie. Wildcard bytes are stored under None
+MATCH = 'match'
+
+
+def compileSignatures(SIGNATURES):
+
+    # Returns the trie: {byte : {byte : {..., MATCH : (length, index, container, candidates)}}, None : {...}}
+    TRIE = {}
+    for (index, (pattern, container, candidates)) in enumerate(SIGNATURES):
+        BYTES = []
+        for part in pattern:
+            if isinstance(part, int):
+                BYTES.extend([None] * part)
+            else:
+                BYTES.extend(part)
+
+        node = TRIE
+        for byte in BYTES:
+            node = node.setdefault(byte, {})
+        node[MATCH] = (len(BYTES), index, container, candidates)
+
+    return TRIE
+
+TRIE = compileSignatures(SIGNATURES)
+
+
+def match(header):
+
+    # Walks the trie along the header, following the wildcard branch next to the byte branch
+    # Returns the (container, candidates) of the longest signature that matches, or None
+    best = None
+    STACK = [(TRIE, 0)]
+    while STACK:
+        (node, position) = STACK.pop()
+        if MATCH in node:
+            (length, index, container, candidates) = node[MATCH]
+            if best is None or (length, -index) > (best[0], -best[1]):
+                best = node[MATCH]
+        if position >= len(header):
+            continue
+        for byte in (header[position], None):
+            if byte in node:
+                STACK.append((node[byte], position + 1))
+
+    if best is None:
+        return None
+    return best[2], best[3]
+
+
+def sniff(asset):
+
+    # One read of the start of the asset. Returns (container, candidates) or (None, [])
+    with open(asset, 'rb') as f:
+        header = f.read(SNIFF_BYTES)
+
+    result = match(header)
+    if result is None:
+        return None, []
+    return result
+
+
+def classify(asset, extClass):
+
+    # extClass is the asset class of the extension (None if the extension is not listed)
+    # Returns {'assetClass', 'mimeType', 'container', 'source'}, source is 'signature' or 'extension'
+    (container, candidates) = sniff(asset)
+
+    if not candidates:
+        return {
+            'assetClass' : extClass or 'Other',
+            'mimeType' : None,
+            'container' : None,
+            'source' : 'extension',
+        }
+
+    (assetClass, mimeType) = candidates[0]
+    for (candidateClass, candidateMime) in candidates:
+        if candidateClass == extClass:
+            (assetClass, mimeType) = (candidateClass, candidateMime)
+            break
+
+    if extClass is not None and extClass != assetClass:
+        logging.warning("Content of %s is %s (%s), not %s as its extension says", asset, container, assetClass, extClass)
+
+    return {
+        'assetClass' : assetClass,
+        'mimeType' : mimeType,
+        'container' : container,
+        'source' : 'signature',
+    }
@@ -0,0 +1,140 @@
+""" In-process image thumbnails
+
+createThumbnailFromImage used to start ImageMagick's convert for every image, which decodes every pixel of the original
+to write a 640 pixel wide JPEG. With Pillow the image is decoded in draft mode instead: the JPEG decoder scales by 1/2, 1/4
+or 1/8 while it reads the DCT blocks, so a 24 megapixel photo is decoded at a fraction of the size (and the CPU time).
+The EXIF orientation is applied, like convert's -auto-orient, and any number of sizes is written from the one decode.
+
+Images Pillow can't read (RAW, HEIC, PSD, ...), or hosts without Pillow, go through convert as before,
+still with a single decode for all of the sizes.
+
+Renditions are the thumbnails the UI picks from for grids and previews (160 to 1280 pixels wide, as JPEG and WebP),
+so it no longer downloads the 640 pixel thumbnail and scales it in the browser.
+
+Functions:
+    createThumbnails -- writes a thumbnail of an image for each requested size, returns the tool used
+    renditionOutputs -- the outputs and the database rendition map for a set of widths and formats
+
+"""
+
+import subprocess
+
+import logging
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+JPEG_QUALITY = 85
+
+# Widths of the renditions. Each rendition fits in a 16:9 box of that width, like the 640x360 thumbnail
+RENDITIONS = [160, 320, 640, 1280]
+RENDITION_FORMATS = ['jpg', 'webp']
+
+# File extension -> Pillow format
+SAVE_FORMATS = {
+    'jpg' : 'JPEG',
+    'webp' : 'WEBP',
+}
+
+# EXIF Orientation tag and the transposes that turn each value upright
+ORIENTATION_TAG = 274
+ORIENTATIONS = {}
+if Image is not None:
+    ORIENTATIONS = {
+        2 : [Image.FLIP_LEFT_RIGHT],
+        3 : [Image.ROTATE_180],
+        4 : [Image.FLIP_TOP_BOTTOM],
+        5 : [Image.ROTATE_90, Image.FLIP_TOP_BOTTOM],
+        6 : [Image.ROTATE_270],
+        7 : [Image.ROTATE_270, Image.FLIP_TOP_BOTTOM],
+        8 : [Image.ROTATE_90],
+    }
+
+# Errors that send an image to convert instead. Pillow raises IOError for formats it does not know, SyntaxError for
+# some broken headers, KeyError when it was built without a writer (e.g. WebP) and DecompressionBombError (Pillow 5+)
+# for images of more than twice MAX_IMAGE_PIXELS, which convert handles within its own resource limits
+PILLOW_ERRORS = (IOError, KeyError, ValueError, SyntaxError)
+if Image is not None and hasattr(Image, 'DecompressionBombError'):
+    PILLOW_ERRORS += (Image.DecompressionBombError,)
+
+
+def createThumbnails(asset, OUTPUTS):
+
+    # OUTPUTS is a list of (path, (width, height)). Each thumbnail fits in its box and keeps the aspect ratio
+    # The format is taken from the extension of the path (see SAVE_FORMATS)
+    # Returns 'pillow' or 'convert'. Raises subprocess.CalledProcessError if convert fails as well
+    if Image is not None:
+        try:
+            pillowThumbnails(asset, OUTPUTS)
+            return 'pillow'
+        except PILLOW_ERRORS as err:
+            logging.debug("Pillow could not create thumbnails of %s, using convert: %s", asset, str(err))
+
+    convertThumbnails(asset, OUTPUTS)
+    return 'convert'
+
+
+def pillowThumbnails(asset, OUTPUTS):
+
+    image = Image.open(asset)
+
+    # Draft mode only applies to JPEG. The box is square as the orientation may still swap width and height
+    largest = max([max(size) for (path, size) in OUTPUTS])
+    image.draft('RGB', (largest, largest))
+
+    image = orient(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # Largest first, each one is scaled down from the previous one
+    for (path, size) in sorted(OUTPUTS, key=lambda output: output[1][0] * output[1][1], reverse=True):
+        image.thumbnail(size, Image.ANTIALIAS)
+        image.save(path, SAVE_FORMATS[path.rsplit('.', 1)[-1].lower()], quality=JPEG_QUALITY)
+
+
+def orient(image):
+
+    try:
+        orientation = image._getexif().get(ORIENTATION_TAG)
+    except (AttributeError, KeyError, IndexError, TypeError):
+        # Not a JPEG or no EXIF data
+        return image
+
+    for method in ORIENTATIONS.get(orientation, []):
+        image = image.transpose(method)
+    return image
+
+
+def convertThumbnails(asset, OUTPUTS):
+
+    # convert <asset> -auto-orient ( +clone -thumbnail 640x360 -write a.jpg +delete ) -thumbnail 160x90 b.jpg
+    cmd = ['convert', asset, '-auto-orient']
+    for (path, size) in OUTPUTS[:-1]:
+        cmd.extend(['(', '+clone', '-thumbnail', '%dx%d' % size, '-write', path, '+delete', ')'])
+    (path, size) = OUTPUTS[-1]
+    cmd.extend(['-thumbnail', '%dx%d' % size, path])
+
+    logging.debug("Execute image thumbnail creation: %s", cmd)
+    return subprocess.check_output(cmd)
+
+
+def renditionOutputs(subDir, newDir, fileName, WIDTHS=RENDITIONS, FORMATS=RENDITION_FORMATS, maxWidth=None):
+
+    # Returns the OUTPUTS for createThumbnails and the rendition map that goes in the database entry:
+    #   {'160' : {'jpg' : '/thumbnails/<fileName>_rendition_160.jpg', 'webp' : ...}, '320' : ...}
+    # DynamoDB map keys are strings, hence the width as a string
+    # Widths above maxWidth (the width of the source) are left out rather than upscaled
+    OUTPUTS = []
+    RENDITIONMAP = {}
+    for width in WIDTHS:
+        if maxWidth is not None and width > maxWidth:
+            continue
+        size = (width, width * 9 / 16)
+        for fmt in FORMATS:
+            name = '%s_rendition_%d.%s' % (fileName, width, fmt)
+            OUTPUTS.append(('%s/%s' % (subDir, name), size))
+            RENDITIONMAP.setdefault(str(width), {})[fmt] = '/%s/%s' % (newDir, name)
+
+    return OUTPUTS, RENDITIONMAP
@@ -0,0 +1,197 @@
+""" This function creates the web-versions of an audio file and its waveform, and registers them with the DB
+
+Function will take the following steps:
+    Create a converted directory
+    Utilize FFMPEG to decode the audio once and write, from the loudness normalized signal:
+        An AAC (M4A) file, the PDL every browser plays
+        An Opus (WebM) file, about half the size for the same quality
+        Mono 16 bit PCM at WAVEFORM_SAMPLE_RATE for the waveform, a temporary file
+    Compute the waveform peaks from the PCM with NumPy and write them as JSON
+    Update the database entry with the PDL, Opus and waveform paths
+    Return success or failure
+
+The waveform JSON has the layout of audiowaveform / peaks.js, so the UI can draw it without downloading the audio:
+    {'version' : 2, 'channels' : 1, 'sample_rate' : 8000, 'samples_per_pixel' : N, 'bits' : 8, 'length' : L, 'data' : [min, max, ...]}
+
+"""
+
+import sys
+import os
+import subprocess
+import string
+import time
+import simplejson as json
+import multiprocessing
+import numpy
+
+import logging
+import logging.config
+
+sys.path.insert(0, '/Assets/sharedLibraries')
+import parseHelper
+import databaseHelper
+
+import activityWorker
+import ffmpegHelper
+
+
+DOMAIN = 'ITD'
+TASKNAME = 'transcodeAudioDefault'
+
+# An audio encode only takes a core or so
+POLLERS = 1
+WORKERS = max(1, multiprocessing.cpu_count() / 2)
+
+# EBU R128 style single pass loudness normalization: integrated loudness, true peak and loudness range
+LOUDNORM = 'loudnorm=I=-16:TP=-1.5:LRA=11'
+AAC_BITRATE = '192k'
+OPUS_BITRATE = '96k'
+
+# The waveform only needs the envelope, 8 kHz mono is plenty
+WAVEFORM_SAMPLE_RATE = 8000
+# Number of (min, max) pairs in the waveform, whatever the length of the audio
+WAVEFORM_POINTS = 2000
+
+def main(args):
+
+    logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
+
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, domain=DOMAIN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
+    asset = INPUT['asset']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+
+    # Re-upload of a deleted asset whose PDL and waveform are still in S3 (see dedupHelper)
+    REUSE = INPUT.get('reuse', {})
+    if 'PDL' in REUSE and 'waveform' in REUSE:
+        logging.info("[%s] Reusing the existing PDL and waveform", workID)
+        OUTPUT = {
+            'tool' : '',
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'],
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        return OUTPUT
+
+    newDir = "converted"
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    subDir = parseHelper.createDir(filePath, newDir)
+
+    aacfile = '%s_PDL.m4a' % (fileName)
+    opusfile = '%s_PDL.webm' % (fileName)
+    waveformfile = '%s_waveform.json' % (fileName)
+    # The PCM is not distributed, it is written next to the asset and removed once the peaks are computed
+    pcmfile = '%s/%s_waveform.pcm' % (filePath, fileName)
+
+    # One decode and one normalization for the three outputs
+    cmd = ['ffmpeg'
+        ,'-y'
+        ,'-loglevel', 'fatal'
+        ,'-i', asset
+        ,'-filter_complex', '[0:a:0]%s,aresample=48000,asplit=3[aac][opus][pcm]' % (LOUDNORM)
+        ,'-map', '[aac]', '-c:a', 'aac', '-b:a', AAC_BITRATE, '-movflags', '+faststart'
+        ,'%s/%s' %(subDir, aacfile)
+        ,'-map', '[opus]', '-c:a', 'libopus', '-b:a', OPUS_BITRATE
+        ,'%s/%s' %(subDir, opusfile)
+        ,'-map', '[pcm]', '-ac', '1', '-ar', str(WAVEFORM_SAMPLE_RATE), '-c:a', 'pcm_s16le', '-f', 's16le'
+        ,pcmfile
+    ]
+
+    try:
+        startTime = time.time()
+        duration = ffmpegHelper.probeDuration(asset)
+
+        # Progress of the encode is sent as the task heartbeat, a stalled ffmpeg runs into the heartbeat timeout
+        logging.debug("[%s] Execute audio transcoding PDL creation: %s", workID, cmd)
+        output = ffmpegHelper.runParallel([cmd], 1, task.get('heartbeat'), duration)
+
+        WAVEFORM = computeWaveform(pcmfile)
+        with open('%s/%s' %(subDir, waveformfile), 'w') as f:
+            json.dump(WAVEFORM, f)
+
+        STATS = ffmpegHelper.throughput(duration, time.time() - startTime)
+        logging.info("[%s] Transcoded %s seconds of audio in %.1f seconds", workID, duration, STATS['seconds'])
+
+        OUTPUT = {
+            'tool' : output,
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'],
+            'asset' : asset,
+            'reuse' : REUSE,
+            'throughput' : STATS,
+        }
+
+        logging.debug("[%s] Update PDL value", workID)
+        updateExpression = 'set PDL = :t, PDL_Opus = :o, waveform = :w'
+
+        expressionValues = {
+            ':t' : '/%s/%s' %(newDir, aacfile),
+            ':o' : '/%s/%s' %(newDir, opusfile),
+            ':w' : '/%s/%s' %(newDir, waveformfile),
+        }
+
+        response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
+
+        return OUTPUT
+
+    # We should catch other errors here
+    except subprocess.CalledProcessError as err:
+
+        result = {
+            'reason' : 'TRC-0003_Error in audio transcode',
+            'detail' : str(err)
+        }
+        raise activityWorker.TaskFailure(result)
+
+    finally:
+        try:
+            os.remove(pcmfile)
+        except OSError:
+            pass
+
+def computeWaveform(pcmfile):
+
+    # The samples are memory mapped and reduced in one vectorized pass: the PCM is cut into WAVEFORM_POINTS blocks of
+    # samplesPerPixel samples and the min and max of every block are taken at once
+    SAMPLES = numpy.memmap(pcmfile, dtype='<i2', mode='r') if os.path.getsize(pcmfile) else numpy.zeros(0, dtype='<i2')
+
+    samplesPerPixel = max(1, int(numpy.ceil(len(SAMPLES) / float(WAVEFORM_POINTS))))
+    length = int(numpy.ceil(len(SAMPLES) / float(samplesPerPixel)))
+
+    # The full blocks are a reshaped view of the memmap, nothing is copied. The short last block is reduced on its own
+    full = len(SAMPLES) // samplesPerPixel
+    BLOCKS = SAMPLES[:full * samplesPerPixel].reshape(full, samplesPerPixel)
+    REST = SAMPLES[full * samplesPerPixel:]
+
+    # 16 bit samples scaled to the 8 bit values of the waveform format, min and max of each block interleaved
+    PEAKS = numpy.empty((length, 2), dtype=numpy.int8)
+    if full:
+        PEAKS[:full, 0] = BLOCKS.min(axis=1) >> 8
+        PEAKS[:full, 1] = BLOCKS.max(axis=1) >> 8
+    if len(REST):
+        PEAKS[full] = (REST.min() >> 8, REST.max() >> 8)
+
+    return {
+        'version' : 2,
+        'channels' : 1,
+        'sample_rate' : WAVEFORM_SAMPLE_RATE,
+        'samples_per_pixel' : samplesPerPixel,
+        'bits' : 8,
+        'length' : length,
+        'data' : PEAKS.ravel().tolist(),
+    }
+
+if __name__ == '__main__':
+
+    main(sys.argv)
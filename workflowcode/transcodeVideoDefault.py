@@ -3,7 +3,8 @@
 Function will take the following steps:
     Create a thumbnail directory
     Utilize FFMPEG to create an MP4 file
-    NOTE: Can we do HLS at some point
+        Sources that are already H.264 / AAC in MP4 or MOV are copied into the MP4 instead (see checkRemux)
+        Long videos are cut at keyframes, encoded in segments on several cores and joined (see transcodeSegmented)
     Update the database entry with a Thumbnail section
     Return success or failure
 
@@ -11,14 +12,15 @@ author: Michael Schuler [mischuler@deloitte.com]
 
 """
 
-import boto3
-from botocore.client import Config
-import botocore
 import sys
 import os
 import subprocess
 import string
+import time
+import shutil
+import tempfile
 import simplejson as json
+import multiprocessing
 
 import logging
 import logging.config
@@ -27,103 +29,312 @@ sys.path.insert(0, '/Assets/sharedLibraries')
 import parseHelper
 import databaseHelper
 
+import activityWorker
+import ffmpegHelper
 
 
-def main(args):
+DOMAIN = 'ITD'
+TASKNAME = 'transcodeVideoDefault'
+
+# libx264 already uses every core on its own, more than a couple of jobs would just contend
+POLLERS = 1
+WORKERS = max(1, multiprocessing.cpu_count() / 4)
+
+# single: one ffmpeg over the whole file
+# segmented: the video is cut at keyframes into SEGMENT_PROCESSES parts that are encoded side by side, the audio is encoded once
+# next to them, and the parts are joined with the concat demuxer (stream copy, no second encode)
+TRANSCODE_MODE = 'segmented'
+SEGMENT_PROCESSES = 4
+# Shorter videos use single, the start up of the extra processes would cost more than it saves
+SEGMENT_MIN_DURATION = 120 # seconds
+
+# Sources within these limits are already a valid PDL. They are copied into the MP4 (remux) instead of encoded
+# MediaInfo reports both MP4 and MOV as MPEG-4. The bit rate leaves room for phone recordings (~17 Mb/s at 1080p)
+REMUX_CONTAINERS = ['MPEG-4']
+REMUX_VIDEO_FORMATS = ['AVC']
+REMUX_VIDEO_PROFILES = ['Baseline', 'Constrained Baseline', 'Main', 'High']
+REMUX_AUDIO_FORMATS = ['AAC']
+REMUX_MAX_BIT_RATE = 20000000
+REMUX_MAX_SIZE = (1920, 1080)
+# Typical speed of the libx264 encode on the workers, in x realtime (see the throughput of encoded PDLs)
+# Used to estimate the time a remux saved
+ENCODE_SPEED = 1.5
 
-    DOMAIN = 'ITD'
-    TASKLIST = 'default'
-    VERSION = '1'
+# Same settings for single and segmented, so that both produce the same PDL
+VIDEO_ARGS = ['-c:v', 'libx264', '-preset', 'fast', '-crf', '22']
+AUDIO_ARGS = ['-c:a', 'aac']
 
-    taskName = os.path.basename(__file__)[:-3]
+def main(args):
 
     logging.config.fileConfig('/Assets/sharedLibraries/logging_config.ini')
-    logging.debug("Creating SWF boto client")
-    botoConfig = Config(connect_timeout=50, read_timeout=70) # suggestion is the read is higher than connect
-    swf = boto3.client('swf', config=botoConfig)
-    logging.debug("Created SWF boto client: %s", swf)
+
+    worker = createWorker()
+    worker.run()
+
+
+def createWorker(client=None):
+
+    return activityWorker.ActivityWorker(TASKNAME, processTask, domain=DOMAIN, pollers=POLLERS, workers=WORKERS, client=client)
+
+
+def processTask(task, workID):
+
+    INPUT = json.loads(task['input'])
+    asset = INPUT['asset']
+    dbPrimaryKey = INPUT['dbPrimaryKey']
+
+    # Re-upload of a deleted asset whose PDL is still in S3 (see dedupHelper)
+    REUSE = INPUT.get('reuse', {})
+    if 'PDL' in REUSE:
+        logging.info("[%s] Reusing the existing PDL", workID)
+        OUTPUT = {
+            'tool' : '',
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : asset,
+            'reuse' : REUSE,
+        }
+        return OUTPUT
+
+     # Take the thumbnail 25% through the video
+    newDir = "converted"
+    (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
+    subDir = parseHelper.createDir(filePath, newDir)
     
-    while True:
+    # We require the %d to keep the file names incremented
+    # Note that we need to escape the percentage sign by using another %, hence the double %
+    outfile = '%s_PDL.mp4' % (fileName)
 
-        task = swf.poll_for_activity_task(
-            domain=DOMAIN,
-            taskList={'name': taskName},
-            identity='%s-01' %(taskName)
-        )
+    # The mode can be picked per request, otherwise the module default is used
+    transcodeMode = INPUT.get('transcodeMode', TRANSCODE_MODE)
 
-        if 'taskToken' not in task:
-            logging.info("%s - Poll timed out, no new task. Repoll", taskName)
-        
-        # Run the operation
-        else:
-            taskToken = task['taskToken']
-            workID = task['workflowExecution']['workflowId']
-            logging.info("[%s] New request for %s", workID, taskName)
-
-            INPUT = json.loads(task['input'])
-            asset = INPUT['asset']
-            dbPrimaryKey = INPUT['dbPrimaryKey']
-             # Take the thumbnail 25% through the video
-            newDir = "converted"
-            (filePath, fileName, fileExt) = parseHelper.splitFilename(asset)
-            subDir = parseHelper.createDir(filePath, newDir)
-            
-            # We require the %d to keep the file names incremented
-            # Note that we need to escape the percentage sign by using another %, hence the double %
-            outfile = '%s_PDL.mp4' % (fileName)
+    # Progress of the encode is sent as the task heartbeat, a stalled ffmpeg runs into the heartbeat timeout
+    heartbeat = task.get('heartbeat')
 
+    try:
+        startTime = time.time()
+        duration = ffmpegHelper.probeDuration(asset)
+
+        # The tracks MediaInfo read in extractMediainfoMetadata decide whether the source needs an encode at all
+        reason = checkRemux(INPUT.get('media'))
+        mode = None
+        if reason is None:
             cmd = ['ffmpeg'
                     ,'-y'
                     ,'-i', asset
-                    ,'-c:v', 'libx264'
-                    ,'-preset','fast'
-                    ,'-crf', '22'
-                    ,'-c:a', 'aac'
+                    ,'-map', '0:v:0'
+                    ,'-map', '0:a:0?'
+                    ,'-c', 'copy'
+                    ,'-movflags', '+faststart'
                     ,'-loglevel', 'fatal'
-                    ,'%s/%s' %(subDir, outfile) 
+                    ,'%s/%s' %(subDir, outfile)
             ]
 
-            logging.debug("[%s] Execute video transcoding PDL creation: %s", workID, cmd)
+            logging.info("[%s] Source is already H.264 / AAC, remuxing the PDL", workID)
+            logging.debug("[%s] Execute video remux PDL creation: %s", workID, cmd)
             try:
-                output = subprocess.check_output(cmd)
-                
-                OUTPUT = {
-                    'tool' : output,
-                    'dbPrimaryKey' : dbPrimaryKey,
-                    'assetClass' : INPUT['assetClass'], 
-                    'asset' : asset,
-                }
-                
-                logging.debug("[%s] Update PDL value", workID)
-                updateExpression = 'set PDL = :t'
-    
-                expressionValues = {
-                    ':t' : '/%s/%s' %(newDir, outfile),
-                }
-    
-                response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
-                
-                swf.respond_activity_task_completed(
-                    taskToken = taskToken,
-                    result = json.dumps(OUTPUT)
-                )
-            # We should catch other errors here
+                output = ffmpegHelper.runParallel([cmd], 1, heartbeat, duration)
+                mode = 'remux'
+            # MediaInfo can pass streams that the MP4 muxer refuses, those are encoded as usual
             except subprocess.CalledProcessError as err:
-                logger.log('E', err.returncode)
-                
-                result = { 
-                    'reason' : 'TRC-0001_Error in MP4 conversation',
-                    'detail' : str(err)
-                }
-                
-                logging.error("%s", result)
-                swf.respond_activity_task_failed(
-                    taskToken=taskToken,
-                    reason=json.dumps(result['reason']),
-                    details=json.dumps(result['detail'])
-                )
-                    
-            logging.info("[%s] %s Complete", workID, taskName)
+                logging.warning("[%s] Remux failed, encoding instead: %s", workID, str(err))
+                reason = 'remux failed'
+
+        if mode is None and transcodeMode == 'segmented' and duration is not None and duration >= SEGMENT_MIN_DURATION:
+            mode = 'segmented'
+            output = transcodeSegmented(asset, '%s/%s' %(subDir, outfile), subDir, duration, workID, heartbeat)
+        elif mode is None:
+            mode = 'single'
+            cmd = ['ffmpeg'
+                    ,'-y'
+                    ,'-i', asset
+                    ] + VIDEO_ARGS + AUDIO_ARGS + [
+                    '-loglevel', 'fatal'
+                    ,'%s/%s' %(subDir, outfile) 
+            ]
+
+            logging.debug("[%s] Execute video transcoding PDL creation: %s", workID, cmd)
+            output = ffmpegHelper.runParallel([cmd], 1, heartbeat, duration)
+
+        STATS = ffmpegHelper.throughput(duration, time.time() - startTime)
+        STATS['mode'] = mode
+        if reason is not None:
+            STATS['encodeReason'] = reason
+        elif duration:
+            STATS['estimatedSavedSeconds'] = round(max(0, duration / ENCODE_SPEED - STATS['seconds']), 1)
+        logging.info("[%s] Created the PDL (%s) of %s seconds of video in %.1f seconds", workID, mode, duration, STATS['seconds'])
+        
+        OUTPUT = {
+            'tool' : output,
+            'dbPrimaryKey' : dbPrimaryKey,
+            'assetClass' : INPUT['assetClass'], 
+            'asset' : asset,
+            'reuse' : REUSE,
+            'throughput' : STATS,
+        }
+        
+        logging.debug("[%s] Update PDL value", workID)
+        updateExpression = 'set PDL = :t, PDL_Transcode = :s'
+
+        # Parsing with decimals, as floats are not permitted by dynamoDB
+        expressionValues = {
+            ':t' : '/%s/%s' %(newDir, outfile),
+            ':s' : json.loads(json.dumps(STATS), use_decimal=True),
+        }
+
+        response = databaseHelper.updateEntry(dbPrimaryKey, updateExpression, expressionValues)
+        
+        return OUTPUT
+
+    # We should catch other errors here
+    except subprocess.CalledProcessError as err:
+        
+        result = { 
+            'reason' : 'TRC-0001_Error in MP4 conversation',
+            'detail' : str(err)
+        }
+        raise activityWorker.TaskFailure(result)
+
+def checkRemux(MEDIA):
+
+    # Returns None when the source can be copied into the PDL as it is, otherwise why it has to be encoded
+    # MEDIA is the media summary of the extract activity (see metadataHelper.mediaSummary)
+    if not MEDIA:
+        return 'no media summary'
+
+    VIDEO = MEDIA.get('video') or {}
+    AUDIO = MEDIA.get('audio') or {}
+
+    if MEDIA.get('container') not in REMUX_CONTAINERS:
+        return 'container %s' % (MEDIA.get('container'))
+    if MEDIA.get('videoTracks') != 1 or MEDIA.get('audioTracks', 0) > 1:
+        return '%s video and %s audio tracks' % (MEDIA.get('videoTracks'), MEDIA.get('audioTracks'))
+    if VIDEO.get('format') not in REMUX_VIDEO_FORMATS:
+        return 'video format %s' % (VIDEO.get('format'))
+    # format_profile is e.g. High@L4.1
+    if (VIDEO.get('format_profile') or '').split('@')[0] not in REMUX_VIDEO_PROFILES:
+        return 'video profile %s' % (VIDEO.get('format_profile'))
+    if VIDEO.get('bit_depth') not in (None, 8) or VIDEO.get('chroma_subsampling') not in (None, '4:2:0'):
+        return 'video is %s bit %s' % (VIDEO.get('bit_depth'), VIDEO.get('chroma_subsampling'))
+    if VIDEO.get('scan_type') not in (None, 'Progressive'):
+        return 'video is %s' % (VIDEO.get('scan_type'))
+    try:
+        width = int(VIDEO.get('width'))
+        height = int(VIDEO.get('height'))
+    except (TypeError, ValueError):
+        return 'no video size'
+    if max(width, height) > max(REMUX_MAX_SIZE) or min(width, height) > min(REMUX_MAX_SIZE):
+        return 'video size %dx%d' % (width, height)
+    try:
+        if int(VIDEO.get('bit_rate')) > REMUX_MAX_BIT_RATE:
+            return 'video bit rate %s' % (VIDEO.get('bit_rate'))
+    except (TypeError, ValueError):
+        return 'no video bit rate'
+    if AUDIO and AUDIO.get('format') not in REMUX_AUDIO_FORMATS:
+        return 'audio format %s' % (AUDIO.get('format'))
+
+    return None
+
+def transcodeSegmented(asset, outpath, subDir, duration, workID, heartbeat=None):
+
+    # The video is cut at keyframes of the source (see splitPoints), so every segment starts on a GOP boundary: the decode of a
+    # segment starts at its first frame instead of mid-GOP, and no frame is dropped or duplicated at the joins.
+    # Each encoded segment starts with its own IDR frame, so the concat demuxer can join them with a stream copy.
+    # The audio is encoded in one piece, AAC priming samples at every cut would be audible as clicks.
+    workDir = tempfile.mkdtemp(prefix='segments_', dir=subDir)
+    try:
+        # Only the packets around the cut targets are probed. A long source takes a while even so, hence the heartbeats
+        KEYFRAMES = ffmpegHelper.probeKeyframes(asset, splitTargets(duration, SEGMENT_PROCESSES), heartbeat=heartbeat)
+        CUTS = splitPoints(KEYFRAMES, duration, SEGMENT_PROCESSES)
+        logging.debug("[%s] Segment cuts at keyframes: %s", workID, CUTS)
+        threads = str(max(1, multiprocessing.cpu_count() / len(CUTS)))
+
+        cmds = []
+        SEGMENTS = []
+        for (i, start) in enumerate(CUTS):
+            segment = '%s/segment_%d.mp4' % (workDir, i)
+            SEGMENTS.append(segment)
+            cmd = ['ffmpeg'
+                ,'-y'
+                ,'-ss', '%.6f' % (start)
+                ]
+            # The last segment runs to the end, whatever the rounding of the duration
+            if i < len(CUTS) - 1:
+                cmd.extend(['-t', '%.6f' % (CUTS[i + 1] - start)])
+            cmd.extend(['-i', asset
+                ,'-an'
+                ] + VIDEO_ARGS + [
+                '-threads', threads
+                ,'-loglevel', 'fatal'
+                ,segment
+            ])
+            cmds.append(cmd)
+
+        audio = None
+        if ffmpegHelper.hasAudio(asset):
+            audio = '%s/audio.m4a' % (workDir)
+            cmds.append(['ffmpeg'
+                ,'-y'
+                ,'-i', asset
+                ,'-vn'
+                ] + AUDIO_ARGS + [
+                '-loglevel', 'fatal'
+                ,audio
+            ])
+
+        # The audio covers the whole duration a second time
+        covered = duration
+        if audio is not None:
+            covered = duration * 2
+
+        logging.debug("[%s] Execute segmented video transcoding: %s", workID, cmds)
+        output = ffmpegHelper.runParallel(cmds, len(cmds), heartbeat, covered)
+
+        listFile = '%s/segments.txt' % (workDir)
+        with open(listFile, 'w') as f:
+            for segment in SEGMENTS:
+                f.write("file '%s'\n" % (segment))
+
+        cmd = ['ffmpeg'
+            ,'-y'
+            ,'-f', 'concat'
+            ,'-safe', '0'
+            ,'-i', listFile
+            ]
+        if audio is not None:
+            cmd.extend(['-i', audio, '-map', '0:v', '-map', '1:a'])
+        cmd.extend(['-c', 'copy'
+            ,'-movflags', '+faststart'
+            ,'-loglevel', 'fatal'
+            ,outpath
+        ])
+
+        logging.debug("[%s] Execute segment concatenation: %s", workID, cmd)
+        output = output + ffmpegHelper.runParallel([cmd], 1, heartbeat, duration)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return output
+
+def splitTargets(duration, segments):
+
+    # The ideal cuts: every duration / segments
+    return [i * duration / segments for i in range(1, segments)]
+
+def splitPoints(KEYFRAMES, duration, segments):
+
+    # The start of each segment: 0 and the keyframes closest to every target of splitTargets, without repeats
+    # A source with few keyframes (or none reported) gets fewer segments, down to a single one
+    CUTS = [0.0]
+    for target in splitTargets(duration, segments):
+        LATER = [keyframe for keyframe in KEYFRAMES if keyframe > CUTS[-1]]
+        if not LATER:
+            break
+        cut = min(LATER, key=lambda keyframe: abs(keyframe - target))
+        if cut < duration:
+            CUTS.append(cut)
+
+    return CUTS
 
 if __name__ == '__main__':
     
@@ -0,0 +1,230 @@
+""" Workflow graph loaded from a state machine definition
+
+The ingest graph is written down once, in the Amazon States Language of SFNcode/IPD.json, and every backend runs from it:
+    Step Functions runs IPD.json itself
+    The SWF deciders (decider.py, fileManager.py) ask the graph which activities come next instead of walking if/elif chains
+
+Supported states:
+    Task -- an activity, named by the last part of its Resource (an activity ARN or a plain name)
+    Choice -- StringEquals, NumericEquals / LessThan / GreaterThan (and the Equals variants), BooleanEquals, And, Or, Not, Default
+    Parallel -- every branch starts at once and Next is taken when the last Task of each branch has completed
+    Pass, Succeed
+Variables are simple paths into the input ($.assetClass, $.a.b).
+HeartbeatSeconds and the States.Timeout (or States.ALL) Retry rules of a Task are kept for the SWF deciders (heartbeats, retries).
+
+The transitions that only depend on $.assetClass are worked out once for every asset class when the graph is loaded,
+so the decision loop is a dictionary lookup keyed by (activity, assetClass). Everything else is evaluated on the input.
+
+Functions:
+    load -- reads a definition file and returns its WorkflowGraph
+
+"""
+
+import os
+import collections
+import simplejson as json
+
+import logging
+
+# Asset classes identifyAssetClass can return
+ASSET_CLASSES = ['Image', 'Video', 'Audio', 'Other']
+
+# Step Functions activity names that have a different name as SWF activity types
+ALIASES = {
+    'extractMediaInfoMetadata' : 'extractMediainfoMetadata',
+    'transcodeVideo' : 'transcodeVideoDefault',
+    'transcodeAudio' : 'transcodeAudioDefault',
+}
+
+# What to do after an activity (or at the start):
+#   tasks -- activities to schedule, all at once. Empty when the workflow is complete
+#   join -- activities that must all have completed before the tasks are scheduled (end of a Parallel state), or None
+Transition = collections.namedtuple('Transition', ['tasks', 'join'])
+
+COMPARISONS = {
+    'StringEquals' : lambda a, b: a == b,
+    'StringLessThan' : lambda a, b: a < b,
+    'StringGreaterThan' : lambda a, b: a > b,
+    'NumericEquals' : lambda a, b: a == b,
+    'NumericLessThan' : lambda a, b: a < b,
+    'NumericGreaterThan' : lambda a, b: a > b,
+    'NumericLessThanEquals' : lambda a, b: a <= b,
+    'NumericGreaterThanEquals' : lambda a, b: a >= b,
+    'BooleanEquals' : lambda a, b: a == b,
+}
+
+
+class MissingVariable(KeyError):
+    pass
+
+
+def load(path):
+
+    with open(path) as f:
+        definition = json.load(f)
+    logging.debug("Loaded workflow definition: %s", path)
+
+    return WorkflowGraph(definition)
+
+
+def activityName(resource):
+
+    # arn:aws:states:<region>:<account>:activity:<name> or just <name>
+    name = resource.split(':')[-1]
+    return ALIASES.get(name, name)
+
+
+def getVariable(INPUT, path):
+
+    value = INPUT
+    for part in path.lstrip('$').strip('.').split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise MissingVariable(path)
+        value = value[part]
+    return value
+
+
+def evaluate(rule, INPUT):
+
+    if 'And' in rule:
+        return all([evaluate(r, INPUT) for r in rule['And']])
+    if 'Or' in rule:
+        return any([evaluate(r, INPUT) for r in rule['Or']])
+    if 'Not' in rule:
+        return not evaluate(rule['Not'], INPUT)
+
+    for (operator, compare) in COMPARISONS.items():
+        if operator in rule:
+            return compare(getVariable(INPUT, rule['Variable']), rule[operator])
+
+    raise ValueError('Unsupported choice rule: %s' % (rule))
+
+
+class WorkflowGraph(object):
+
+    def __init__(self, definition):
+
+        self.startAt = definition['StartAt']
+
+        # Every state, including those inside Parallel branches. State names must be unique across the definition
+        self.states = {}
+        # Parallel state of each state inside a branch
+        self.parents = {}
+        # Task state name <-> activity name
+        self.activities = {}
+        self.stateNames = {}
+        # Last Task of each branch of a Parallel state, the activities the join waits for
+        self.joins = {}
+        # HeartbeatSeconds of each activity that has one, and the number of times an activity that timed out is retried
+        self.heartbeats = {}
+        self.timeoutRetries = {}
+
+        self._addStates(definition['States'], None)
+
+        self.transitions = {}
+        for activity in self.stateNames:
+            for assetClass in ASSET_CLASSES:
+                try:
+                    self.transitions[(activity, assetClass)] = self._next(activity, {'assetClass' : assetClass})
+                except MissingVariable:
+                    # Depends on more than the asset class, evaluated for each decision
+                    pass
+
+        logging.debug("Precomputed %d workflow transitions", len(self.transitions))
+
+    def _addStates(self, STATES, parent):
+
+        for (name, state) in STATES.items():
+            if name in self.states:
+                raise ValueError('State %s is defined more than once' % (name))
+            self.states[name] = state
+            if parent is not None:
+                self.parents[name] = parent
+
+            if state['Type'] == 'Task':
+                activity = activityName(state['Resource'])
+                self.activities[name] = activity
+                self.stateNames[activity] = name
+                if 'HeartbeatSeconds' in state:
+                    self.heartbeats[activity] = state['HeartbeatSeconds']
+                for rule in state.get('Retry', []):
+                    if 'States.Timeout' in rule['ErrorEquals'] or 'States.ALL' in rule['ErrorEquals']:
+                        self.timeoutRetries[activity] = rule.get('MaxAttempts', 3)
+                        break
+
+            elif state['Type'] == 'Parallel':
+                if parent is not None:
+                    raise ValueError('Nested Parallel state %s is not supported' % (name))
+                ENDS = []
+                for branch in state['Branches']:
+                    self._addStates(branch['States'], name)
+                    TAILS = [n for (n, s) in branch['States'].items() if s['Type'] == 'Task' and s.get('End')]
+                    if len(TAILS) != 1:
+                        raise ValueError('Each branch of %s must end with a single Task' % (name))
+                    ENDS.append(activityName(branch['States'][TAILS[0]]['Resource']))
+                self.joins[name] = ENDS
+
+    def start(self, INPUT):
+
+        return Transition(self._enter(self.startAt, INPUT), None)
+
+    def next(self, activity, INPUT):
+
+        # INPUT is the result of the activity, which is also the input of whatever comes next
+        transition = self.transitions.get((activity, INPUT.get('assetClass')))
+        if transition is None:
+            transition = self._next(activity, INPUT)
+        return transition
+
+    def _next(self, activity, INPUT):
+
+        name = self.stateNames[activity]
+        state = self.states[name]
+
+        if 'Next' in state:
+            return Transition(self._enter(state['Next'], INPUT), None)
+
+        # The end of a Parallel branch continues after the Parallel state, once every branch has reached its end
+        parallel = self.parents.get(name)
+        if parallel is not None:
+            return Transition(self._after(parallel, INPUT), self.joins[parallel])
+
+        return Transition([], None)
+
+    def _after(self, name, INPUT):
+
+        state = self.states[name]
+        if 'Next' in state:
+            return self._enter(state['Next'], INPUT)
+        return []
+
+    def _enter(self, name, INPUT):
+
+        # Returns the activities to schedule when the workflow reaches state "name"
+        state = self.states[name]
+        stateType = state['Type']
+
+        if stateType == 'Task':
+            return [self.activities[name]]
+
+        if stateType == 'Choice':
+            for rule in state['Choices']:
+                if evaluate(rule, INPUT):
+                    return self._enter(rule['Next'], INPUT)
+            if 'Default' not in state:
+                raise ValueError('No choice of %s matched and there is no Default' % (name))
+            return self._enter(state['Default'], INPUT)
+
+        if stateType == 'Parallel':
+            TASKS = []
+            for branch in state['Branches']:
+                TASKS.extend(self._enter(branch['StartAt'], INPUT))
+            return TASKS
+
+        if stateType == 'Pass':
+            return self._after(name, INPUT)
+
+        if stateType == 'Succeed':
+            return []
+
+        raise ValueError('Unsupported state type %s in %s' % (stateType, name))
@@ -1,8 +1,10 @@
 #!/bin/sh
 
+# The decider runs on its own, all of the activities are hosted by a single activityHost.py process
+# Stopping sends SIGTERM so the host lets tasks in flight finish before it exits
+
 SCRIPTS=()
 
-SCRIPTS+=('decider.py')
 SCRIPTS+=('identifyAssetClass.py')
 SCRIPTS+=('registerAsset.py')
 SCRIPTS+=('extractExifMetadata.py')
@@ -10,20 +12,21 @@ SCRIPTS+=('extractMediainfoMetadata.py')
 SCRIPTS+=('createThumbnailFromImage.py')
 SCRIPTS+=('createThumbnailFromVideo.py')
 SCRIPTS+=('transcodeVideoDefault.py')
+SCRIPTS+=('packageHLS.py')
+SCRIPTS+=('transcodeAudioDefault.py')
 SCRIPTS+=('distributeToS3.py')
 SCRIPTS+=('cleanUpLandingPad.py')
 
+PIDFILE='activityHost.pid'
+DECIDERPIDFILE='decider.pid'
 
-for i in "${SCRIPTS[@]}"
-do
-	if [ "$1" == "start" ]; then 
-		python $i &
-	else
-		id=`ps u | grep "[p]ython ${i}"`
-		idA=($id)
-		`kill ${idA[1]}`
-	fi
-done
-
-
-
+if [ "$1" == "start" ]; then 
+	python decider.py &
+	echo $! > $DECIDERPIDFILE
+	python activityHost.py "${SCRIPTS[@]%.py}" &
+	echo $! > $PIDFILE
+else
+	kill -TERM `cat $DECIDERPIDFILE`
+	kill -TERM `cat $PIDFILE`
+	rm -f $DECIDERPIDFILE $PIDFILE
+fi